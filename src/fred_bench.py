@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_compile
+import fred_fuzzy
+import fred_lang
+import fred_rules
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+######################################################################
+## benchmark suite
+## generates synthetic JFRED rule files, then times the hot paths
+## against them, writing the results as JSON
+######################################################################
+
+class SynthRules (object):
+    def __init__ (self, n_action, n_regex, n_fuzzy, phrase_len=(1, 4), vocab_size=None, seed=0):
+        self.n_action = n_action
+        self.n_regex = n_regex
+        self.n_fuzzy = n_fuzzy
+        self.phrase_len = phrase_len
+        self.rand = random.Random(seed)
+
+        if not vocab_size:
+            vocab_size = max(100, 2 * (n_regex + n_fuzzy))
+
+        self.vocab = ["w%d" % i for i in xrange(vocab_size)]
+        self.fuzzy_terms = self.vocab[:n_fuzzy]
+        self.phrases = []
+
+
+    def phrase (self):
+        length = self.rand.randint(self.phrase_len[0], self.phrase_len[1])
+        return " ".join([self.rand.choice(self.vocab) for i in xrange(length)])
+
+
+    def write (self, f):
+        """
+        write a rule file in the format which Rule.parse_file() reads
+        """
+
+        f.write("# synthetic rulebase: %d action, %d regex, %d fuzzy\n\n" % (self.n_action, self.n_regex, self.n_fuzzy))
+
+        for i in xrange(self.n_action):
+            f.write("action: a%d\n" % i)
+
+            if i % 10 == 0:
+                f.write("repeat: true\n")
+
+            f.write("Response number %d.\nAnother response, number %d.\n\n" % (i, i))
+
+        for i in xrange(self.n_regex):
+            f.write("regex: r%d\n" % i)
+            f.write("invokes: a%d\n" % self.rand.randrange(self.n_action))
+
+            for j in xrange(self.rand.randint(1, 3)):
+                phrase = self.phrase()
+                self.phrases.append(phrase)
+                f.write(phrase + "\n")
+
+            f.write("\n")
+
+        for term in self.fuzzy_terms:
+            f.write("fuzzy: %s\n" % term)
+
+            for j in xrange(self.rand.randint(1, 4)):
+                f.write("%d\ta%d\n" % (self.rand.randint(1, 9), self.rand.randrange(self.n_action)))
+
+            f.write("\n")
+
+
+    def match_utterances (self, count):
+        """
+        utterances which hit regex phrases and fuzzy terms
+        """
+
+        return [" ".join([self.rand.choice(self.phrases), self.rand.choice(self.vocab), self.phrase()]) for i in xrange(count)]
+
+
+    def nomatch_utterances (self, count):
+        """
+        utterances made of words outside the rulebase vocabulary
+        """
+
+        return [" ".join(["zz%d" % self.rand.randrange(1000) for j in xrange(6)]) for i in xrange(count)]
+
+
+def timed (results, n_rules, stage, calls, func, *args):
+    start = time.time()
+    value = func(*args)
+    elapsed = time.time() - start
+
+    results.append({ "rules": n_rules,
+                     "stage": stage,
+                     "calls": calls,
+                     "total_s": elapsed,
+                     "per_call_us": elapsed / calls * 1e6
+                     })
+
+    return value
+
+
+def rss_bytes ():
+    """
+    resident set size of this process, or its peak where /proc isn't
+    available
+    """
+
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (IOError, OSError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # kilobytes on Linux, bytes on OS X
+        if sys.platform == "darwin":
+            return peak
+        else:
+            return peak * 1024
+
+
+def rss_loaded (rules, filename):
+    """
+    memory held by a rulebase once loaded from its compiled cache, in
+    a fresh process, so that nothing left over from parsing counts
+    """
+
+    cache_file = fred_compile.cache_path(filename)
+    fred_compile.write_cache(rules, fred_compile.source_key(filename), cache_file)
+
+    try:
+        command = [sys.executable, os.path.abspath(__file__), "--measure-cache", filename]
+
+        if rules.store is not None:
+            command.append("--compact")
+
+        return int(subprocess.check_output(command))
+    finally:
+        os.remove(cache_file)
+
+
+def measure_cache (filename, compact):
+    lang = fred_lang.Language()
+    rss_start = rss_bytes()
+    rules = fred_compile.read_cache(lang, filename, fred_compile.cache_path(filename), compact=compact)
+
+    if rules is None:
+        sys.exit("ERROR: no compiled cache for " + filename)
+
+    return rss_bytes() - rss_start
+
+
+def measured (results, n_rules, stage, nbytes):
+    results.append({ "rules": n_rules,
+                     "stage": stage,
+                     "bytes": nbytes
+                     })
+
+
+def bench_size (n_rules, turns, results, fractions=(0.5, 0.3, 0.2), seed=0, compact=False):
+    """
+    generate a rulebase of about n_rules, then time each hot path, and
+    measure the memory held by the loaded rules
+    """
+
+    n_action = max(1, int(n_rules * fractions[0]))
+    n_regex = int(n_rules * fractions[1])
+    n_fuzzy = int(n_rules * fractions[2])
+    synth = SynthRules(n_action, n_regex, n_fuzzy, seed=seed)
+
+    fd, filename = tempfile.mkstemp(suffix=".rules")
+
+    try:
+        with os.fdopen(fd, "w") as f:
+            synth.write(f)
+
+        lang = fred_lang.Language()
+
+        rule_dict, first_action, fuzzy_dict = timed(results, n_rules, "parse_file", 1, fred_rules.Rule.read_file, filename)
+        rules = timed(results, n_rules, "rules_init", 1, fred_rules.Rules, lang, rule_dict, first_action, fuzzy_dict, compact)
+
+        # with compact storage, the parsed rules can go now
+        del rule_dict, first_action, fuzzy_dict
+
+        measured(results, n_rules, "rss_delta", rss_loaded(rules, filename))
+    finally:
+        os.remove(filename)
+
+    if rules.store is not None:
+        measured(results, n_rules, "store", rules.store.nbytes())
+
+    match_utt = synth.match_utterances(turns)
+    nomatch_utt = synth.nomatch_utterances(turns)
+
+    def parse_all ():
+        for utterance in match_utt:
+            lang.parse(utterance)
+
+    def choose_all (utterances):
+        session = rules.new_session()
+
+        for utterance in utterances:
+            rules.choose_rule(utterance, session)
+
+    timed(results, n_rules, "lang_parse", turns, parse_all)
+    timed(results, n_rules, "choose_rule_match", turns, choose_all, match_utt)
+    timed(results, n_rules, "choose_rule_nomatch", turns, choose_all, nomatch_utt)
+
+    fuzzy_union = fred_fuzzy.FuzzyUnion()
+
+    for rule in rules.action_rules[:100]:
+        fuzzy_union.add_rule(rule, random.random())
+
+    def select_all ():
+        for i in xrange(turns):
+            fuzzy_union.select_rule()
+
+    timed(results, n_rules, "select_rule_100", turns, select_all)
+
+
+def parse_args (argv):
+    parser = argparse.ArgumentParser(description="benchmark the pyFRED hot paths")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated rulebase sizes to run")
+    parser.add_argument("--turns", type=int, default=1000,
+                        help="utterances per timed stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compact", action="store_true",
+                        help="load the rules into columnar storage")
+    parser.add_argument("--output", default=None,
+                        help="write the JSON results here, instead of stdout")
+    parser.add_argument("--generate", default=None, metavar="RULE_FILE",
+                        help="only write a synthetic rule file, of the first size")
+    parser.add_argument("--measure-cache", default=None, metavar="RULE_FILE",
+                        help=argparse.SUPPRESS)
+
+    return parser.parse_args(argv)
+
+
+if __name__=='__main__':
+    args = parse_args(sys.argv[1:])
+    sizes = [int(x) for x in args.sizes.split(",")]
+    random.seed(args.seed)
+
+    if args.measure_cache:
+        # run by rss_loaded(), in a fresh process
+        print measure_cache(args.measure_cache, args.compact)
+        sys.exit(0)
+
+    if args.generate:
+        n = sizes[0]
+        synth = SynthRules(n // 2, n * 3 // 10, n // 5, seed=args.seed)
+
+        with open(args.generate, "w") as f:
+            synth.write(f)
+
+        sys.exit(0)
+
+    results = []
+
+    for n_rules in sizes:
+        bench_size(n_rules, args.turns, results, seed=args.seed, compact=args.compact)
+
+    report = { "python": platform.python_version(),
+               "platform": platform.platform(),
+               "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "turns": args.turns,
+               "compact": args.compact,
+               "results": results
+               }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print json.dumps(report, indent=2)
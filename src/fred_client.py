@@ -17,7 +17,11 @@
 ## limitations under the License.
 
 
+import fred_server
+
 import socket
+import timeit
+import time
 
 
 ######################################################################
@@ -30,23 +34,171 @@ class Convo (object):
 
 
 class TCPConvo (Convo):
+    """
+    newline-framed conversation over a socket: clients may pipeline
+    several utterances, which get answered in order, with responses to
+    lines already buffered written out together; reads only happen
+    when no complete line is left, so a client which sends faster than
+    the replies get produced is held back by TCP flow control
+    """
+
     max_line_size = 1024
+    recv_size = 4096
+    max_output_size = 65536
 
     def __init__ (self, client):
         self.client = client
+        self.pending = ""
+        self.output = []
+        self.output_size = 0
+
 
     def converse (self, response):
-        self.client.send(response)
-        return self.client.recv(max_line_size)
+        self.write(response)
+
+        if "\n" not in self.pending or self.output_size >= self.max_output_size:
+            self.flush()
+
+        return self.read_line()
+
+
+    def write (self, data):
+        self.output.append(data)
+        self.output_size += len(data)
+
+
+    def flush (self):
+        if self.output:
+            self.client.sendall("".join(self.output))
+            self.output = []
+            self.output_size = 0
+
+
+    def read_line (self):
+        """
+        return the next line, with its newline; raises EOFError when
+        the client closes, or sends a line longer than max_line_size
+        """
+
+        while True:
+            i = self.pending.find("\n")
+
+            if i > self.max_line_size or (i < 0 and len(self.pending) > self.max_line_size):
+                self.write("ERROR: line too long\n")
+                self.flush()
+                raise EOFError
+
+            if i >= 0:
+                line = self.pending[:i].rstrip("\r") + "\n"
+                self.pending = self.pending[i + 1:]
+                return line
+
+            data = self.client.recv(self.recv_size)
+
+            if not data:
+                raise EOFError
+
+            self.pending += data
 
 
 class FRED (object):
-    def __init__ (self, rules):
+    stats_command = "/stats"
+    session_command = "/session"
+
+    def __init__ (self, rules, stats_interval=None, reloader=None, chat_log=None, sessions=None):
         self.rules = rules
+        self.stats_interval = stats_interval
+        self.stats_dumped = time.time()
+        self.reloader = reloader
+        self.chat_log = chat_log
+        self.sessions = sessions
+
+
+    def check_reload (self):
+        """
+        swap in the reloaded rulebase, if its file changed; sessions
+        in flight just carry on with the new one
+        """
+
+        if self.reloader:
+            rules = self.reloader.poll()
+
+            if rules is not None:
+                self.rules = rules
+
+                if self.sessions:
+                    self.sessions.rules = rules
+
+
+    def dump_stats (self):
+        """
+        periodically print the rule selection stats, if enabled
+        """
+
+        if self.rules.stats and self.stats_interval:
+            now = time.time()
+
+            if now - self.stats_dumped >= self.stats_interval:
+                self.stats_dumped = now
+                print self.format_stats()
+
+
+    def respond (self, utterance, session):
+        """
+        answer one line from a client; returns the response, and the
+        session for the lines after it, which "/session KEY" switches
+        to the persistent session for that key
+        """
+
+        if self.sessions:
+            command = utterance.split()
+
+            if len(command) == 2 and command[0] == FRED.session_command:
+                session = self.sessions.get(command[1])
+                return "session " + command[1], session
+
+        return self.reply(utterance, session), session
+
+
+    def reply (self, utterance, session):
+        self.check_reload()
+
+        if self.rules.stats and utterance.strip() == FRED.stats_command:
+            return self.format_stats()
+
+        if self.chat_log:
+            start = timeit.default_timer()
+            response, selected_rule, weight = self.rules.choose_rule(utterance, session)
+            self.chat_log.record(session, utterance, selected_rule.name, weight, timeit.default_timer() - start)
+        else:
+            print utterance
+
+            response, selected_rule, weight = self.rules.choose_rule(utterance, session)
+            print " (", selected_rule.name, weight, ")"
+
+        if session.key is not None:
+            self.sessions.touch(session)
+
+        return response
+
+
+    def format_stats (self):
+        text = self.rules.stats.format()
+
+        if self.chat_log:
+            info = self.chat_log.info()
+            text += "\nlog queued %d written %d dropped %d errors %d" % (info["queued"], info["written"], info["dropped"], info["errors"])
+
+        if self.sessions:
+            info = self.sessions.info()
+            text += "\nsessions cached %d dirty %d loaded %d created %d written %d errors %d" % (info["cached"], info["dirty"], info["loaded"], info["created"], info["written"], info["errors"])
+
+        return text
 
 
     def chat (self, convo):
-        response = self.rules.choose_first()
+        session = self.rules.new_session()
+        response = self.rules.choose_first(session)
 
         while True:
             try:
@@ -57,28 +209,48 @@ class FRED (object):
             except EOFError:
                 break
             else:
-                print utterance
+                response, session = self.respond(utterance, session)
+                self.dump_stats()
 
-                response, selected_rule, weight = self.rules.choose_rule(utterance)
-                print " (", selected_rule.name, weight, ")"
 
-
-    def chat_tcp (self, port):
+    def chat_tcp (self, port, backlog=5):
         """
         connect through TCP socket
         """
         host = ''
-        backlog = 5
 
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         s.bind((host, port))
-        s.listen(BACKLOG)
+        s.listen(backlog)
 
         while True:
             client, address = s.accept() 
-            self.chat(TCPConvo(client));
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            try:
+                self.chat(TCPConvo(client))
+            except socket.error, e:
+                print "ERROR: connection from", address, e
+
             client.close()
 
 
+    def chat_async (self, port, backlog=128, max_conn=1000, idle_timeout=300.0):
+        """
+        serve many concurrent TCP connections from one event loop
+        """
+        server = fred_server.ChatServer(self, port, backlog=backlog, max_conn=max_conn, idle_timeout=idle_timeout)
+        server.serve_forever()
+
+
+    def chat_prefork (self, port, workers, backlog=128, max_conn=1000, idle_timeout=300.0):
+        """
+        fork worker processes which share the listening socket and
+        the rulebase loaded here
+        """
+        server = fred_server.PreforkServer(self, port, workers, backlog=backlog, max_conn=max_conn, idle_timeout=idle_timeout)
+        server.serve_forever()
+
+
 if __name__=='__main__':
     FRED(None, None).chat(Convo())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_lang
+import fred_rules
+
+import cPickle
+import hashlib
+import os
+import sys
+
+
+######################################################################
+## compiled rulebase cache
+## the parsed rule table, interned response strings, and prebuilt
+## phrase/fuzzy indexes get pickled next to the rule file, keyed by
+## the source file's hash and mtime; the header also holds a digest of
+## the pickled payload, checked before it gets unpickled
+######################################################################
+
+MAGIC = "FREDRC"
+
+# bump whenever the layout of the pickled rule classes changes
+FORMAT_VERSION = 15
+CACHE_SUFFIX = ".frc"
+
+
+def cache_path (filename):
+    return filename + CACHE_SUFFIX
+
+
+def source_key (filename):
+    """
+    return the (sha1, mtime, size) key for a rule file
+    """
+
+    st = os.stat(filename)
+    sha1 = hashlib.sha1()
+
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), ""):
+            sha1.update(chunk)
+
+    return sha1.hexdigest(), st.st_mtime, st.st_size
+
+
+def write_cache (rules, key, cache_file):
+    """
+    write the compiled Rules atomically, via a temp file + rename
+    """
+
+    sha1, mtime, size = key
+    payload = cPickle.dumps(rules, cPickle.HIGHEST_PROTOCOL)
+
+    header = { "version": FORMAT_VERSION, "sha1": sha1, "mtime": mtime, "size": size, "compact": rules.store is not None,
+               "payload_sha1": hashlib.sha1(payload).hexdigest(), "payload_size": len(payload) }
+    tmp_file = "%s.%d.tmp" % (cache_file, os.getpid())
+
+    with open(tmp_file, "wb") as f:
+        f.write(MAGIC)
+        cPickle.dump(header, f, cPickle.HIGHEST_PROTOCOL)
+        f.write(payload)
+
+    os.rename(tmp_file, cache_file)
+
+
+def read_cache (lang, filename, cache_file, compact=False):
+    """
+    return the cached Rules, or None if the cache is missing, stale,
+    or corrupt
+    """
+
+    try:
+        with open(cache_file, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+
+            header = cPickle.load(f)
+
+            if header.get("version") != FORMAT_VERSION or header.get("compact") != compact:
+                return None
+
+            st = os.stat(filename)
+
+            if header["mtime"] != st.st_mtime or header["size"] != st.st_size:
+                # the file got touched; only its content hash counts
+                if header["sha1"] != source_key(filename)[0]:
+                    return None
+
+            payload = f.read()
+
+            if len(payload) != header["payload_size"] or hashlib.sha1(payload).hexdigest() != header["payload_sha1"]:
+                return None
+
+            rules = cPickle.loads(payload)
+    except Exception:
+        # besides I/O errors, a damaged header can fail to unpickle in
+        # just about any way; any of them means a stale cache
+        return None
+
+    rules.lang = lang
+    return rules
+
+
+def compile_file (lang, filename, cache_file=None, compact=False):
+    """
+    parse a rule file in full, and write its compiled cache
+    """
+
+    if not cache_file:
+        cache_file = cache_path(filename)
+
+    key = source_key(filename)
+    rules = fred_rules.Rule.parse_file(lang, filename, compact=compact)
+    write_cache(rules, key, cache_file)
+
+    return rules
+
+
+def load_rules (lang, filename, cache_file=None, compact=False):
+    """
+    load a rule file through its compiled cache, falling back to a
+    full parse (and refreshing the cache) when the cache is stale
+    """
+
+    if not cache_file:
+        cache_file = cache_path(filename)
+
+    rules = read_cache(lang, filename, cache_file, compact=compact)
+
+    if rules is not None:
+        return rules
+
+    key = source_key(filename)
+    rules = fred_rules.Rule.parse_file(lang, filename, compact=compact)
+
+    try:
+        write_cache(rules, key, cache_file)
+    except (IOError, OSError), e:
+        print "WARNING: cannot write rulebase cache", e
+
+    return rules
+
+
+if __name__=='__main__':
+    if len(sys.argv) < 2:
+        ## CLI error, show usage
+        sys.exit("usage:\n  %s rule_file [rule_file ...]" % sys.argv[0])
+
+    lang = fred_lang.Language()
+
+    for filename in sys.argv[1:]:
+        rules = compile_file(lang, filename)
+        print "compiled", filename, "=>", cache_path(filename), "(%d rules)" % len(rules.rule_list)
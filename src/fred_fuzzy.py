@@ -18,7 +18,6 @@
 
 
 import math
-import operator
 import random
 
 
@@ -31,6 +30,10 @@ class FuzzyUnion (object):
     def __init__ (self):
         self.rule_set = {}
 
+        # False when some of the weights couldn't be gathered, e.g.,
+        # from a failed shard, so the union mustn't get cached
+        self.complete = True
+
 
     def add_rule (self, rule, weight):
         if rule.name not in self.rule_set:
@@ -42,41 +45,50 @@ class FuzzyUnion (object):
             self.rule_set[rule.name] = [rule, prev_weight + weight]
 
 
-    @staticmethod
-    def fuzzy_sort (x):
-        [name, [rule, weight]] = x
-        return weight, rule.priority
+    def add_rules (self, members):
+        """
+        merge a prebuilt sequence of (rule, weight) pairs
+        """
 
+        rule_set = self.rule_set
 
-    def select_rule (self):
-        # sort descending based on weight, priority
+        for rule, weight in members:
+            entry = rule_set.get(rule.name)
 
-        sorted_rules = sorted(self.rule_set.items(),
-                              key=lambda x: FuzzyUnion.fuzzy_sort(x),
-                              reverse=True
-                              )
+            if entry is None:
+                rule_set[rule.name] = [rule, weight]
+            else:
+                entry[1] += weight
 
-        weight_dist = map(lambda x: x[1][1], sorted_rules)
-        tot_sum = sum(weight_dist)
 
-        # convert the sorted list of weights into something vaguely
-        # akin to an exponential distribution (if you squint hard)
+    def select_rule (self):
+        entries = self.rule_set.values()
+        weight_dist = [weight for rule, weight in entries]
+
+        # convert the weights into something vaguely akin to an
+        # exponential distribution (if you squint hard)
+        # NB: each rule's chance depends only on its own weight, so
+        # the candidates don't need sorting by (weight, priority)
+        # before the draw
 
+        if min(weight_dist) == max(weight_dist):
+            # equal weights => uniform
+            rule, weight = random.choice(entries)
+            return rule, weight
+
+        tot_sum = sum(weight_dist)
         exp_dist = [math.exp(x / tot_sum * -2.0) for x in weight_dist]
         estimator = random.uniform(0.0, sum(exp_dist))
-        i = 0
 
         # generate a random variable and use that to select a rule
 
-        for x in exp_dist:
-            if estimator <= x:
+        for i in xrange(len(exp_dist)):
+            if estimator <= exp_dist[i]:
                 break
             else:
-                i += 1
-                estimator -= x
+                estimator -= exp_dist[i]
 
-        rule_name, rule_value = sorted_rules[i]
-        rule, weight = self.rule_set[rule_name]
+        rule, weight = entries[i]
 
         return rule, weight
 
@@ -17,6 +17,8 @@
 ## limitations under the License.
 
 
+import fred_lru
+
 import re
 
 
@@ -32,6 +34,10 @@ import re
 class Language (object):
     word_pat = re.compile("([\w\d]+)")
 
+    # the leading word characters of each whitespace-separated token,
+    # i.e., word_pat.match() applied to every token, in one pass
+    token_pat = re.compile("(?<!\S)([\w\d]+)")
+
     tense = { "you": "we robots",
               "i": "you",
               "me": "you",
@@ -46,31 +52,60 @@ class Language (object):
               "us": "y'all"
               }
 
-    def __init__ (self):
-        pass
+    def __init__ (self, cache_size=1024):
+        if cache_size:
+            self.cache = fred_lru.LRUCache(cache_size)
+        else:
+            self.cache = None
 
-    def parse (self, utterance):
-        v = []
 
-        for token in utterance.split(" "):
-            m = Language.word_pat.match(token)
+    def tokenize (self, utterance):
+        return tuple(Language.token_pat.findall(utterance.lower()))
 
-            if m:
-                v.append(m.group(1).lower().strip())
 
-        return tuple(v)
+    @staticmethod
+    def first_positions (tokens):
+        """
+        map each token to the position where it first appears
+        """
 
+        return dict(zip(reversed(tokens), xrange(len(tokens) - 1, -1, -1)))
 
-    def invert (self, fragment):
-        inversion = []
 
-        for word in fragment:
-            if word in Language.tense:
-                inversion.append(Language.tense[word])
-            else:
-                inversion.append(word)
+    def scan (self, utterance):
+        """
+        tokenize, along with the first position of each token,
+        memoizing the results for repeated utterances
+        """
+
+        cache = self.cache
+
+        if cache is not None:
+            result = cache.get(utterance)
+
+            if result is not None:
+                return result
+
+        tokens = self.tokenize(utterance)
+        result = (tokens, Language.first_positions(tokens))
 
-        return inversion
+        if cache is not None:
+            cache.put(utterance, result)
+
+        return result
+
+
+    def parse (self, utterance):
+        """
+        tokenize, memoizing the results for repeated utterances
+        """
+
+        return self.scan(utterance)[0]
+
+
+    def invert (self, fragment):
+        tense = Language.tense
+        return [tense.get(word, word) for word in fragment]
 
 
 if __name__=='__main__':
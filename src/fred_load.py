@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_lang
+import fred_rules
+
+import collections
+import fnmatch
+import multiprocessing
+import os
+import sys
+
+
+######################################################################
+## multi-file loading
+## rulebases split across many files get read block by block, and
+## parsed in a process pool, a bounded number of chunks of blocks at
+## a time, then merged into one Rules, with every error reported by
+## file and line
+######################################################################
+
+def find_files (paths, pattern="*"):
+    """
+    expand directories into the rule files they hold, in sorted order
+    """
+
+    files = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs[:] = sorted([d for d in dirs if not d.startswith(".")])
+
+                for name in sorted(names):
+                    if not name.startswith(".") and not name.endswith(".frc") and fnmatch.fnmatch(name, pattern):
+                        files.append(os.path.join(root, name))
+        else:
+            files.append(path)
+
+    return files
+
+
+def iter_chunks (files, chunk_size):
+    """
+    read each file block by block, generating (filename, blocks,
+    error) with up to chunk_size blocks at a time
+    """
+
+    for filename in files:
+        try:
+            with open(filename, "r") as f:
+                blocks = []
+
+                for block in fred_rules.Rule.iter_blocks(f):
+                    blocks.append(block)
+
+                    if len(blocks) >= chunk_size:
+                        yield filename, blocks, None
+                        blocks = []
+
+                if blocks:
+                    yield filename, blocks, None
+        except (IOError, OSError), e:
+            yield filename, None, "%s: %s" % (filename, e)
+
+
+def parse_blocks (chunk):
+    """
+    worker: parse a chunk of blocks from one file; returns the (line
+    number, rule) pairs, and the error messages
+    """
+
+    filename, blocks = chunk
+    rules = []
+    errors = []
+
+    for lineno, rule_lines in blocks:
+        try:
+            rules.append((lineno, fred_rules.Rule.parse_lines(rule_lines)))
+        except (fred_rules.ParseError, ValueError), e:
+            errors.append("%s:%d: %s" % (filename, lineno, e))
+
+    return rules, errors
+
+
+def chunk_rules (filename, rules, errors):
+    for lineno, rule in rules:
+        yield filename, lineno, rule, None
+
+    if errors:
+        yield filename, None, None, errors
+
+
+def pop_chunk (pending):
+    """
+    wait on the oldest chunk in flight, and generate its rules
+    """
+
+    filename, result, error = pending.popleft()
+
+    if error:
+        rules, errors = [], [error]
+    else:
+        rules, errors = result.get()
+
+    return chunk_rules(filename, rules, errors)
+
+
+def iter_rules (files, processes=None, chunk_size=1000):
+    """
+    generate (filename, line number, rule, errors) as the blocks get
+    parsed, keeping the files and blocks in order; only a few chunks
+    of blocks per worker are in flight at once, so memory stays
+    bounded by the chunk size rather than by the size of a file
+    """
+
+    chunks = iter_chunks(files, chunk_size)
+
+    if processes == 1 or len(files) < 2:
+        for filename, blocks, error in chunks:
+            if error:
+                rules, errors = [], [error]
+            else:
+                rules, errors = parse_blocks((filename, blocks))
+
+            for item in chunk_rules(filename, rules, errors):
+                yield item
+    else:
+        pool = multiprocessing.Pool(processes)
+        max_pending = 2 * (processes or multiprocessing.cpu_count())
+        pending = collections.deque()
+
+        try:
+            for filename, blocks, error in chunks:
+                if error:
+                    pending.append((filename, None, error))
+                else:
+                    pending.append((filename, pool.apply_async(parse_blocks, ((filename, blocks),)), None))
+
+                while len(pending) >= max_pending or (pending and pending[0][1] is not None and pending[0][1].ready()):
+                    for item in pop_chunk(pending):
+                        yield item
+
+            while pending:
+                for item in pop_chunk(pending):
+                    yield item
+        finally:
+            pool.close()
+            pool.join()
+
+
+def load_rules (lang, paths, processes=None, pattern="*", compact=False):
+    """
+    load every rule file under paths into one Rules object; raises
+    ParseError with the list of every error found, if any
+    """
+
+    rule_dict = {}
+    fuzzy_dict = {}
+    first_action = None
+
+    origin = {}
+    errors = []
+
+    for filename, lineno, rule, file_errors in iter_rules(find_files(paths, pattern), processes):
+        if file_errors:
+            errors.extend(file_errors)
+            continue
+
+        # strings don't stay interned across the process boundary
+        rule.vector = map(intern, rule.vector)
+
+        is_fuzzy = isinstance(rule, fred_rules.FuzzyRule)
+        key = (is_fuzzy, rule.name)
+        where = "%s:%d" % (filename, lineno)
+
+        if key in origin and not origin[key].startswith(filename + ":"):
+            errors.append("%s: rule '%s' collides with %s" % (where, rule.name, origin[key]))
+            continue
+
+        origin[key] = where
+
+        if is_fuzzy:
+            fuzzy_dict[rule.name] = rule
+        else:
+            rule_dict[rule.name] = rule
+
+            if not first_action and isinstance(rule, fred_rules.ActionRule):
+                first_action = rule
+
+    # check the references now, so that they get reported along with
+    # everything else, rather than exiting
+
+    for rule in rule_dict.values():
+        if isinstance(rule, fred_rules.RegexRule):
+            for name in rule.invokes.split(" "):
+                if name not in rule_dict:
+                    errors.append("%s: references unknown action rule '%s'" % (origin[(False, rule.name)], name))
+
+        elif isinstance(rule, fred_rules.ActionRule) and rule.next:
+            if not isinstance(rule_dict.get(rule.next), fred_rules.ActionRule):
+                errors.append("%s: next references unknown action rule '%s'" % (origin[(False, rule.name)], rule.next))
+
+    for rule in fuzzy_dict.values():
+        for name in rule.members:
+            if name not in rule_dict:
+                errors.append("%s: fuzzy set references unknown rule '%s'" % (origin[(True, rule.name)], name))
+
+    if not first_action:
+        errors.append("no action rules found in: " + " ".join(paths))
+
+    if errors:
+        raise fred_rules.ParseError(errors)
+
+    return fred_rules.Rules(lang, rule_dict, first_action, fuzzy_dict, compact=compact)
+
+
+if __name__=='__main__':
+    if len(sys.argv) < 2:
+        ## CLI error, show usage
+        sys.exit("usage:\n  %s rule_dir_or_file [...]" % sys.argv[0])
+
+    try:
+        rules = load_rules(fred_lang.Language(), sys.argv[1:])
+    except fred_rules.ParseError, e:
+        for error in e.value:
+            print "ERROR:", error
+
+        sys.exit(1)
+
+    print "loaded %d rules, %d fuzzy sets" % (len(rules.rule_list), len(rules.fuzzy_sets))
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_rules
+
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import timeit
+
+
+######################################################################
+## load generator
+## many concurrent localhost connections, each replaying utterances
+## turn by turn, reporting throughput, response latency percentiles,
+## and connection errors
+######################################################################
+
+PROMPT = "\n> "
+
+
+def transcript_utterances (filename):
+    """
+    one utterance per non-blank line
+    """
+
+    with open(filename, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def rule_utterances (filename, count, seed=0):
+    """
+    synthesize utterances from the vocabulary of a rule file: its
+    regex phrases and fuzzy terms, mixed with a few stray words
+    """
+
+    rule_dict, first_action, fuzzy_dict = fred_rules.Rule.read_file(filename)
+    phrases = []
+
+    for rule in rule_dict.values():
+        if isinstance(rule, fred_rules.RegexRule):
+            phrases.extend(rule.vector)
+
+    terms = sorted(fuzzy_dict.keys())
+    phrases.sort()
+    rand = random.Random(seed)
+    utterances = []
+
+    for i in xrange(count):
+        words = []
+
+        if phrases:
+            words.append(rand.choice(phrases))
+
+        if terms:
+            words.append(rand.choice(terms))
+
+        words.append("zz%d" % rand.randrange(1000))
+        rand.shuffle(words)
+        utterances.append(" ".join(words))
+
+    return utterances
+
+
+def percentile (values, p):
+    """
+    nearest-rank percentile of an already sorted list
+    """
+
+    if not values:
+        return 0.0
+
+    rank = int(math.ceil(p / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+class Client (threading.Thread):
+    """
+    one connection: wait for the greeting, then send each utterance
+    and time how long its response takes to arrive
+    """
+
+    def __init__ (self, host, port, utterances, timeout):
+        super(Client, self).__init__()
+        self.daemon = True
+
+        self.host = host
+        self.port = port
+        self.utterances = utterances
+        self.timeout = timeout
+
+        self.latencies = []
+        self.errors = []
+
+
+    def read_prompt (self, sock, pending):
+        """
+        read until the server's prompt; returns whatever came after it
+        """
+
+        while PROMPT not in pending:
+            data = sock.recv(4096)
+
+            if not data:
+                raise IOError("connection closed by server")
+
+            pending += data
+
+            if pending.startswith("ERROR:"):
+                raise IOError(pending.strip())
+
+        return pending[pending.index(PROMPT) + len(PROMPT):]
+
+
+    def run (self):
+        clock = timeit.default_timer
+
+        try:
+            sock = socket.create_connection((self.host, self.port), self.timeout)
+        except (socket.error, IOError), e:
+            self.errors.append("connect: %s" % e)
+            return
+
+        try:
+            pending = self.read_prompt(sock, "")
+
+            for utterance in self.utterances:
+                start = clock()
+                sock.sendall(utterance + "\n")
+                pending = self.read_prompt(sock, pending)
+                self.latencies.append(clock() - start)
+        except (socket.error, IOError), e:
+            self.errors.append("turn %d: %s" % (len(self.latencies), e))
+        finally:
+            sock.close()
+
+
+def run_load (host, port, utterances, connections, turns, timeout=10.0, seed=0):
+    """
+    open the connections all at once, give each one its own slice of
+    turns, and return the report
+    """
+
+    rand = random.Random(seed)
+    clients = []
+
+    for i in xrange(connections):
+        clients.append(Client(host, port, [rand.choice(utterances) for j in xrange(turns)], timeout))
+
+    start = time.time()
+
+    for client in clients:
+        client.start()
+
+    for client in clients:
+        client.join()
+
+    elapsed = time.time() - start
+
+    latencies = sorted([t for client in clients for t in client.latencies])
+    errors = [e for client in clients for e in client.errors]
+    failed = len([client for client in clients if client.errors])
+
+    return { "connections": connections,
+             "turns_per_connection": turns,
+             "turns": len(latencies),
+             "elapsed_s": round(elapsed, 3),
+             "throughput_tps": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+             "latency_ms": { "p50": round(percentile(latencies, 50) * 1e3, 3),
+                             "p95": round(percentile(latencies, 95) * 1e3, 3),
+                             "p99": round(percentile(latencies, 99) * 1e3, 3),
+                             "max": round(latencies[-1] * 1e3, 3) if latencies else 0.0
+                             },
+             "failed_connections": failed,
+             "errors": len(errors),
+             "error_samples": errors[:10]
+             }
+
+
+def free_port ():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def spawn_server (rule_file, port, server_args, wait=30.0):
+    """
+    start pyfred.py on a local port, and wait until it accepts
+    """
+
+    pyfred = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pyfred.py")
+    proc = subprocess.Popen([sys.executable, pyfred, rule_file, str(port)] + server_args,
+                            stdout=open(os.devnull, "w"))
+
+    deadline = time.time() + wait
+
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise IOError("server exited with status %d" % proc.returncode)
+
+        try:
+            socket.create_connection(("127.0.0.1", port), 1.0).close()
+            return proc
+        except socket.error:
+            time.sleep(0.1)
+
+    proc.terminate()
+    raise IOError("server did not start listening within %d seconds" % wait)
+
+
+def parse_args (argv):
+    parser = argparse.ArgumentParser(description="load test a pyFRED chat server on localhost")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None,
+                        help="port of a running server")
+    parser.add_argument("--spawn", default=None, metavar="RULE_FILE",
+                        help="start pyfred.py on this rule file, on a free port, for the run")
+    parser.add_argument("--server-args", default="",
+                        help="extra pyfred.py options for --spawn, e.g. '--async'")
+    parser.add_argument("--transcript", default=None,
+                        help="replay utterances from this file, one per line")
+    parser.add_argument("--rules", default=None, metavar="RULE_FILE",
+                        help="synthesize utterances from the vocabulary of this rule file")
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=20,
+                        help="utterances sent per connection")
+    parser.add_argument("--timeout", type=float, default=10.0,
+                        help="seconds to wait on a connect or a response")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None,
+                        help="write the JSON report here, instead of stdout")
+
+    return parser.parse_args(argv)
+
+
+if __name__=='__main__':
+    args = parse_args(sys.argv[1:])
+
+    if args.transcript:
+        utterances = transcript_utterances(args.transcript)
+    elif args.rules or args.spawn:
+        utterances = rule_utterances(args.rules or args.spawn, 1000, seed=args.seed)
+    else:
+        ## CLI error, show usage
+        sys.exit("usage:\n  %s (--port PORT | --spawn RULE_FILE) (--transcript FILE | --rules RULE_FILE)" % sys.argv[0])
+
+    if not utterances:
+        sys.exit("no utterances to replay")
+
+    proc = None
+
+    if args.spawn:
+        args.host = "127.0.0.1"
+        args.port = free_port()
+        proc = spawn_server(args.spawn, args.port, args.server_args.split())
+    elif args.port is None:
+        sys.exit("either --port or --spawn is needed")
+
+    try:
+        report = run_load(args.host, args.port, utterances, args.connections, args.turns, timeout=args.timeout, seed=args.seed)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    report["server"] = args.spawn and ("pyfred.py %s %s" % (args.spawn, args.server_args)).strip() or "%s:%d" % (args.host, args.port)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print json.dumps(report, indent=2)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import Queue
+import json
+import os
+import threading
+import time
+
+
+######################################################################
+## conversation log
+## replies enqueue a record without ever blocking; a background thread
+## writes them in batches to append-only files, rotated by size, and
+## records which arrive while the queue is full get counted as drops
+######################################################################
+
+STOP = None
+
+
+class ChatLog (object):
+    def __init__ (self, path, max_bytes=64 << 20, backups=5, batch_size=256, max_queue=10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+
+        self.queue = Queue.Queue(max_queue)
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+        self.owner = os.getpid()
+        self.pid = None
+        self.thread = None
+
+
+    def start (self):
+        """
+        start the writer thread; threads don't survive a fork, so each
+        worker process starts its own, writing to its own file
+        """
+
+        self.pid = os.getpid()
+
+        if self.pid != self.owner:
+            self.owner = self.pid
+            self.path = "%s.%d" % (self.path, self.pid)
+            self.queue = Queue.Queue(self.queue.maxsize)
+            self.written = self.dropped = self.errors = 0
+
+        self.thread = threading.Thread(target=self.run, name="fred-log")
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def record (self, session, utterance, rule_name, weight, latency):
+        """
+        queue one turn of a conversation, dropping it if the writer
+        has fallen too far behind
+        """
+
+        if self.pid != os.getpid():
+            self.start()
+
+        try:
+            self.queue.put_nowait((time.time(), self.pid, session.id, utterance, rule_name, weight, latency))
+        except Queue.Full:
+            self.dropped += 1
+
+
+    def run (self):
+        f = open(self.path, "a")
+
+        try:
+            while True:
+                batch = [self.queue.get()]
+
+                try:
+                    while len(batch) < self.batch_size and batch[-1] is not STOP:
+                        batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    pass
+
+                stop = batch[-1] is STOP
+
+                if stop:
+                    batch.pop()
+
+                if batch:
+                    f = self.write(f, batch)
+
+                if stop:
+                    break
+        finally:
+            f.close()
+
+
+    def write (self, f, batch):
+        """
+        write a batch in one call, then rotate the file once it has
+        grown past max_bytes; returns the file to write next
+        """
+
+        lines = []
+
+        for (t, pid, session_id, utterance, rule_name, weight, latency) in batch:
+            lines.append(json.dumps({ "time": round(t, 3),
+                                      "pid": pid,
+                                      "session": session_id,
+                                      "utterance": utterance,
+                                      "rule": rule_name,
+                                      "weight": weight,
+                                      "latency_us": int(latency * 1e6)
+                                      }))
+
+        try:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            self.written += len(batch)
+
+            if f.tell() >= self.max_bytes:
+                f.close()
+                self.rotate()
+                f = open(self.path, "a")
+        except (IOError, OSError, ValueError), e:
+            self.errors += 1
+
+            if self.errors == 1:
+                print "ERROR: cannot write conversation log", self.path, e
+
+        return f
+
+
+    def rotate (self):
+        """
+        path => path.1 => path.2 ... keeping the given number of backups
+        """
+
+        for i in xrange(self.backups - 1, 0, -1):
+            src = "%s.%d" % (self.path, i)
+
+            if os.path.exists(src):
+                os.rename(src, "%s.%d" % (self.path, i + 1))
+
+        if self.backups > 0:
+            os.rename(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+
+
+    def close (self, timeout=5.0):
+        """
+        flush whatever is queued, then stop the writer
+        """
+
+        if self.thread is not None and self.pid == os.getpid():
+            try:
+                self.queue.put(STOP, timeout=timeout)
+            except Queue.Full:
+                pass
+
+            self.thread.join(timeout)
+            self.thread = None
+
+
+    def info (self):
+        return { "queued": self.queue.qsize(), "written": self.written, "dropped": self.dropped, "errors": self.errors }
+
+
+if __name__=='__main__':
+    class Dummy (object):
+        id = 1
+
+    log = ChatLog("/tmp/fred_log_test.log")
+
+    for i in xrange(1000):
+        log.record(Dummy(), "hello %d" % i, "greet", 1.0, 0.0001)
+
+    log.close()
+    print log.info()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import threading
+
+
+######################################################################
+## bounded LRU cache
+## a dict plus a circular doubly-linked list of [prev, next, key, value]
+## nodes; even get() relinks nodes, so a lock guards every operation,
+## for a Rules or Language shared across threads
+######################################################################
+
+PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+
+class LRUCache (object):
+    def __init__ (self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.table = {}
+        self.root = []
+        self.root[:] = [self.root, self.root, None, None]
+
+
+    def __getstate__ (self):
+        # locks don't pickle, and neither do the cached entries
+        return { "maxsize": self.maxsize }
+
+
+    def __setstate__ (self, state):
+        self.__init__(state["maxsize"])
+
+
+    def __len__ (self):
+        return len(self.table)
+
+
+    def __contains__ (self, key):
+        return key in self.table
+
+
+    def get (self, key, default=None):
+        with self.lock:
+            node = self.table.get(key)
+
+            if node is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+
+            # move the node to the most-recent end
+            prev, next = node[PREV], node[NEXT]
+            prev[NEXT] = next
+            next[PREV] = prev
+
+            root = self.root
+            last = root[PREV]
+            last[NEXT] = root[PREV] = node
+            node[PREV] = last
+            node[NEXT] = root
+
+            return node[VALUE]
+
+
+    def put (self, key, value):
+        with self.lock:
+            table = self.table
+            root = self.root
+            node = table.get(key)
+
+            if node is not None:
+                # replace, and unlink so it gets re-added as most recent
+                node[PREV][NEXT] = node[NEXT]
+                node[NEXT][PREV] = node[PREV]
+            elif len(table) >= self.maxsize:
+                # evict the least-recent node
+                oldest = root[NEXT]
+
+                if oldest is root:
+                    return
+
+                root[NEXT] = oldest[NEXT]
+                oldest[NEXT][PREV] = root
+                del table[oldest[KEY]]
+
+            last = root[PREV]
+            node = [last, root, key, value]
+            last[NEXT] = root[PREV] = table[key] = node
+
+
+    def clear (self):
+        with self.lock:
+            self.table.clear()
+            self.root[:] = [self.root, self.root, None, None]
+
+
+    def info (self):
+        return { "size": len(self.table), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses }
+
+
+if __name__=='__main__':
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    print "b" in cache, cache.get("a"), cache.get("c"), cache.info()
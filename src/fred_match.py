@@ -0,0 +1,408 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import re
+import sre_constants
+import sre_parse
+
+
+######################################################################
+## phrase matching
+## an Aho-Corasick automaton over token tuples, so that every regex
+## phrase in the rulebase gets found in one pass over the stimulus
+######################################################################
+
+class PhraseMatcher (object):
+    # an overlay of edits gets folded into a full rebuild once it
+    # grows past max(min_rebuild, rebuild_ratio * phrases)
+    min_rebuild = 1024
+    rebuild_ratio = 0.1
+
+    def __init__ (self, phrases):
+        """
+        build the automaton from a dict of phrase_tuple => value
+        """
+
+        self.phrases = []
+        self.empty = []
+
+        # phrases edited since the automaton got built
+        self.overlay = None
+        self.overlay_phrases = {}
+        self.masked = frozenset()
+
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+
+        for phrase, value in phrases.items():
+            self.add(phrase, value)
+
+        self.compile()
+
+
+    def add (self, phrase, value):
+        """
+        insert one phrase into the trie; call compile() afterwards
+        """
+
+        phrase_id = len(self.phrases)
+        self.phrases.append((phrase, value))
+
+        if not phrase:
+            # an empty phrase matches any non-empty stimulus
+            self.empty.append(phrase_id)
+            return
+
+        state = 0
+
+        for token in phrase:
+            next_state = self.goto[state].get(token)
+
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(())
+                self.goto[state][token] = next_state
+
+            state = next_state
+
+        self.output[state] += (phrase_id,)
+
+
+    def compile (self):
+        """
+        breadth-first pass to set the failure links, and fold the
+        outputs of each failure state into its parent
+        """
+
+        queue = list(self.goto[0].values())
+
+        for state in queue:
+            self.fail[state] = 0
+
+        i = 0
+
+        while i < len(queue):
+            state = queue[i]
+            i += 1
+
+            for token, next_state in self.goto[state].items():
+                queue.append(next_state)
+                f = self.fail[state]
+
+                while f and token not in self.goto[f]:
+                    f = self.fail[f]
+
+                f = self.goto[f].get(token, 0)
+
+                if f == next_state:
+                    f = 0
+
+                self.fail[next_state] = f
+                self.output[next_state] += self.output[f]
+
+
+    def match (self, tokens):
+        """
+        return the (phrase, value) pairs for every phrase which occurs
+        as a sublist of tokens, each reported once
+        """
+
+        if not tokens:
+            return []
+
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+
+        found = set(self.empty)
+        state = 0
+
+        for token in tokens:
+            while state and token not in goto[state]:
+                state = fail[state]
+
+            state = goto[state].get(token, 0)
+
+            if output[state]:
+                found.update(output[state])
+
+        found = [self.phrases[i] for i in found]
+
+        if self.overlay is not None:
+            masked = self.masked
+            found = [x for x in found if x[0] not in masked]
+            found.extend(self.overlay.match(tokens))
+
+        return found
+
+
+    def scanner (self):
+        """
+        return a PhraseScanner, to match tokens as they arrive
+        """
+
+        return PhraseScanner(self)
+
+
+    def updated (self, added, removed):
+        """
+        return a new matcher with the phrases in the dict added (or
+        replaced) and the phrases in removed dropped; the edits get
+        layered over this automaton, which stays shared and unchanged,
+        until the layer grows large enough to warrant a rebuild
+        """
+
+        overlay_phrases = dict(self.overlay_phrases)
+        masked = set(self.masked)
+
+        for phrase in removed:
+            overlay_phrases.pop(phrase, None)
+            masked.add(phrase)
+
+        for (phrase, value) in added.items():
+            overlay_phrases[phrase] = value
+            masked.add(phrase)
+
+        if len(masked) > max(PhraseMatcher.min_rebuild, PhraseMatcher.rebuild_ratio * len(self.phrases)):
+            phrases = dict([x for x in self.phrases if x[0] not in masked])
+            phrases.update(overlay_phrases)
+            return PhraseMatcher(phrases)
+
+        matcher = object.__new__(PhraseMatcher)
+        matcher.__dict__.update(self.__dict__)
+
+        matcher.overlay_phrases = overlay_phrases
+        matcher.masked = frozenset(masked)
+        matcher.overlay = PhraseMatcher(overlay_phrases)
+
+        return matcher
+
+
+class PhraseScanner (object):
+    """
+    match() one token at a time, keeping the automaton state between
+    tokens; each phrase gets reported once, by the feed() of the token
+    which completes it
+    """
+
+    def __init__ (self, matcher):
+        self.matcher = matcher
+        self.state = 0
+        self.found = set()
+        self.started = False
+
+        if matcher.overlay is not None:
+            self.overlay = matcher.overlay.scanner()
+        else:
+            self.overlay = None
+
+
+    def feed (self, token):
+        """
+        advance by one token, and return the (phrase, value) pairs
+        newly found
+        """
+
+        matcher = self.matcher
+        goto = matcher.goto
+        fail = matcher.fail
+        state = self.state
+
+        while state and token not in goto[state]:
+            state = fail[state]
+
+        self.state = state = goto[state].get(token, 0)
+        ids = matcher.output[state]
+
+        if not self.started:
+            # the empty phrases match once there's any token at all
+            self.started = True
+            ids = tuple(matcher.empty) + ids
+
+        found = self.found
+        new = []
+
+        for i in ids:
+            if i not in found:
+                found.add(i)
+                new.append(matcher.phrases[i])
+
+        if self.overlay is not None:
+            masked = matcher.masked
+            new = [x for x in new if x[0] not in masked]
+            new.extend(self.overlay.feed(token))
+
+        return new
+
+
+######################################################################
+## pattern matching
+## the "/pattern/" lines of regex rules; a pattern which requires some
+## literal word only gets run when the stimulus has that token, found
+## by dict lookup, while the patterns with no such word get combined
+## into as few regexes as the group limit allows, each one in an
+## optional lookahead with a capturing group, so that one match() at
+## the start of the stimulus reports every one of them found in it;
+## NB: Python 2 regexes have no multi-pattern automaton, so each of
+## those lookaheads still scans on its own, and their cost is linear
+## in their number
+######################################################################
+
+class PatternMatcher (object):
+    # Python 2 regexes are limited to 100 groups
+    max_groups = 99
+
+    # only match whole tokens, as the literal phrases do
+    wrapper = "(?<![^ ])(?:%s)(?![^ ])"
+
+    backref_pat = re.compile(r"\\(?:[1-9]|g<)|\(\?P=")
+    word_pat = re.compile(r"^\w+$")
+
+    def __init__ (self, patterns):
+        """
+        index and combine a dict of pattern => value
+        """
+
+        self.patterns = patterns
+        self.keyed = {}
+        self.chunks = []
+
+        parts = []
+        groups = []
+        num_groups = 0
+
+        for pattern in sorted(patterns):
+            regex = re.compile(pattern, re.I)
+            words = PatternMatcher.required_words(pattern)
+
+            if words:
+                # the longest word is likely the rarest
+                word = max(words, key=len)
+                self.keyed.setdefault(word, []).append((re.compile(PatternMatcher.wrapper % pattern, re.I), pattern))
+                continue
+
+            if regex.groupindex or PatternMatcher.backref_pat.search(pattern):
+                # named groups and backreferences can't be renumbered,
+                # so these get a regex of their own
+                self.chunks.append((re.compile(PatternMatcher.wrapper % pattern, re.I), None, pattern))
+                continue
+
+            width = regex.groups + 1
+
+            if parts and num_groups + width > PatternMatcher.max_groups:
+                self.add_chunk(parts, groups)
+                parts, groups, num_groups = [], [], 0
+
+            groups.append((num_groups + 1, pattern))
+            parts.append("(?:(?=.*?(" + PatternMatcher.wrapper % pattern + ")))?")
+            num_groups += width
+
+        if parts:
+            self.add_chunk(parts, groups)
+
+
+    @staticmethod
+    def required_words (pattern):
+        """
+        the words which any match of the pattern must contain as whole
+        tokens: runs of literal characters in its top-level sequence,
+        split at literal spaces, where each word is bounded by a space
+        or by the edge of the pattern
+        """
+
+        try:
+            items = list(sre_parse.parse(pattern, re.I))
+        except (sre_constants.error, RuntimeError):
+            return []
+
+        words = []
+        run = []
+        run_start = 0
+
+        for i in xrange(len(items) + 1):
+            if i < len(items) and items[i][0] == sre_constants.LITERAL and items[i][1] < 128:
+                if not run:
+                    run_start = i
+
+                run.append(chr(items[i][1]).lower())
+                continue
+
+            if run:
+                pieces = "".join(run).split(" ")
+
+                for j in xrange(len(pieces)):
+                    bounded_left = j > 0 or run_start == 0
+                    bounded_right = j < len(pieces) - 1 or i == len(items)
+
+                    if bounded_left and bounded_right and PatternMatcher.word_pat.match(pieces[j]):
+                        words.append(pieces[j])
+
+                run = []
+
+        return words
+
+
+    def add_chunk (self, parts, groups):
+        self.chunks.append((re.compile("".join(parts), re.I), groups, None))
+
+
+    def match (self, tokens):
+        """
+        return a list of (pattern, value) for every pattern which
+        matches the tokens, joined by single spaces
+        """
+
+        if not self.chunks and not self.keyed:
+            return []
+
+        text = " ".join(tokens)
+        patterns = self.patterns
+        found = []
+
+        if self.keyed:
+            keyed = self.keyed
+
+            for token in set(tokens):
+                for (regex, pattern) in keyed.get(token, ()):
+                    if regex.search(text):
+                        found.append((pattern, patterns[pattern]))
+
+        for (regex, groups, pattern) in self.chunks:
+            if groups is None:
+                if regex.search(text):
+                    found.append((pattern, patterns[pattern]))
+            else:
+                m = regex.match(text)
+
+                for (i, pattern) in groups:
+                    if m.group(i) is not None:
+                        found.append((pattern, patterns[pattern]))
+
+        return found
+
+
+if __name__=='__main__':
+    matcher = PhraseMatcher({ ("your", "name"): 1, ("name", "is"): 2, ("is",): 3 })
+    print matcher.match(("what", "is", "your", "name"))
+
+    matcher = PatternMatcher({ "i (like|love) \\w+": 1, "(\\w+) and \\1": 2, "colou?r": 3 })
+    print matcher.match(("i", "love", "red", "and", "red", "colour"))
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_rules
+
+import os
+import time
+
+
+######################################################################
+## hot reload
+## watch a rule file, re-parse only the blocks whose text changed,
+## and derive the next Rules incrementally from the current one
+######################################################################
+
+class RuleReloader (object):
+    def __init__ (self, filename, rules, interval=2.0):
+        self.filename = filename
+        self.rules = rules
+        self.interval = interval
+        self.checked = time.time()
+        self.stamp = self.file_stamp()
+        self.blocks = self.seed_blocks()
+
+
+    def file_stamp (self):
+        st = os.stat(self.filename)
+        return st.st_mtime, st.st_size
+
+
+    def seed_blocks (self):
+        """
+        map the text of each block in the file to the rule already
+        loaded from it, matching on the name in its header line
+        """
+
+        named = {}
+
+        with open(self.filename, "r") as f:
+            for lineno, rule_lines in fred_rules.Rule.iter_blocks(f):
+                m = fred_rules.Rule.rule_pat.match(rule_lines[0])
+
+                if m:
+                    kind, name = m.group(1).lower().strip(), m.group(2).lower().strip()
+                    named.setdefault((kind == "fuzzy", name), []).append("\n".join(rule_lines))
+
+        blocks = {}
+
+        for ((is_fuzzy, name), texts) in named.items():
+            if is_fuzzy:
+                rule = self.rules.fuzzy_rules.get(name)
+            else:
+                rule = self.rules.rule_dict.get(name)
+
+            # a duplicated name can't be told apart without parsing
+            if rule is not None and len(texts) == 1:
+                blocks[texts[0]] = rule
+
+        return blocks
+
+
+    def reload (self):
+        """
+        re-read the rule file, parsing only the new or edited blocks,
+        and return the next Rules; raises ParseError, listing every
+        bad block, and keeps the current Rules if anything fails
+        """
+
+        blocks = {}
+        rule_dict = {}
+        fuzzy_dict = {}
+        first_action = None
+        errors = []
+
+        with open(self.filename, "r") as f:
+            for lineno, rule_lines in fred_rules.Rule.iter_blocks(f):
+                text = "\n".join(rule_lines)
+                rule = self.blocks.get(text)
+
+                if rule is None:
+                    try:
+                        rule = fred_rules.Rule.parse_lines(rule_lines)
+                    except (fred_rules.ParseError, ValueError), e:
+                        errors.append("%s:%d: %s" % (self.filename, lineno, e))
+                        continue
+
+                blocks[text] = rule
+
+                if isinstance(rule, fred_rules.FuzzyRule):
+                    fuzzy_dict[rule.name] = rule
+                else:
+                    rule_dict[rule.name] = rule
+
+                    if not first_action and isinstance(rule, fred_rules.ActionRule):
+                        first_action = rule
+
+        if errors:
+            raise fred_rules.ParseError(errors)
+
+        old = self.rules
+
+        changed = [r for (name, r) in rule_dict.items() if old.rule_dict.get(name) is not r]
+        removed = [name for name in old.rule_dict if name not in rule_dict]
+        changed_fuzzy = [r for (name, r) in fuzzy_dict.items() if old.fuzzy_rules.get(name) is not r]
+        removed_fuzzy = [name for name in old.fuzzy_rules if name not in fuzzy_dict]
+
+        self.rules = old.update(changed, removed, changed_fuzzy, removed_fuzzy, first_action)
+        self.blocks = blocks
+
+        return self.rules
+
+
+    def poll (self):
+        """
+        check the rule file at most once per interval; return the
+        reloaded Rules if it changed, otherwise None
+        """
+
+        now = time.time()
+
+        if now - self.checked < self.interval:
+            return None
+
+        self.checked = now
+
+        try:
+            stamp = self.file_stamp()
+
+            if stamp == self.stamp:
+                return None
+
+            self.stamp = stamp
+            return self.reload()
+        except (fred_rules.ParseError, IOError, OSError), e:
+            print "ERROR: cannot reload", self.filename, e
+            return None
+
+
+if __name__=='__main__':
+    print RuleReloader
@@ -18,11 +18,22 @@
 
 
 import fred_fuzzy
+import fred_lru
+import fred_match
+import fred_session
+import fred_stream
+import fred_typo
 
+import array
 import random
 import re
 import sys
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 ######################################################################
 ## rule classes
@@ -37,17 +48,53 @@ class ParseError (Exception):
 
 
 class Rules (object):
-    def __init__ (self, lang, rule_dict, first_action, fuzzy_dict):
+    candidate_cache_size = 4096
+
+    # rejection draws for the no-match fallback, before it scans
+    max_fallback_draws = 32
+
+    def __init__ (self, lang, rule_dict, first_action, fuzzy_dict, compact=False):
         self.lang = lang
         self.rule_dict = rule_dict
         self.first_action = first_action
 
-        # 1. create an inverted index for the fuzzy sets
+        # 0. number the rules, so that per-session state can be kept
+        # in compact arrays indexed by rule id
+
+        self.rule_list = sorted(self.rule_dict.values(), key=lambda r: r.name)
+
+        for i in range(0, len(self.rule_list)):
+            self.rule_list[i].id = i
+
+        # optionally, move the rules into columnar storage, and index
+        # lightweight views of them instead
+
+        self.store = None
+
+        if compact:
+            import fred_store
+
+            self.store = fred_store.RuleStore(self.rule_list)
+            self.rule_list = list(self.store.views)
+            self.rule_dict = dict(rule_dict)
+
+            for r in self.rule_list:
+                self.rule_dict[r.name] = r
+
+            if first_action:
+                self.first_action = self.rule_dict[first_action.name]
 
+        self.session = self.new_session()
+
+        # 1. create an inverted index for the fuzzy sets, keyed by
+        # token, with prebuilt (rule, weight) members
+
+        self.fuzzy_rules = fuzzy_dict
         self.fuzzy_sets = {}
+        self.fuzzy_deps = {}
 
         for (name, r) in fuzzy_dict.items():
-            self.fuzzy_sets[name] = map(lambda x: (self.rule_dict[r.members[x]], r.weights[x]), range(0, len(r.members)))
+            self.fuzzy_sets[name] = self.index_fuzzy(r)
 
         # 2. randomly shuffle the order of responses within all the
         # action rules, and establish priority rankings (later)
@@ -58,26 +105,558 @@ class Rules (object):
 
         self.intro_rules = [r for r in self.rule_dict.values() if isinstance(r, IntroRule)]
 
-        # 4. create an inverted index for the regex phrases
+        # 4. create an inverted index for the regex phrases, plus a
+        # combined matcher for the "/pattern/" lines
 
         self.regex_phrases = {}
+        self.regex_patterns = {}
+        self.regex_sources = {}
+        self.regex_deps = {}
+
+        # the regex rules listing each phrase or pattern; one which
+        # several rules list invokes all of their rules
+        self.phrase_owners = {}
+        self.pattern_owners = {}
 
         for r in self.rule_dict.values():
             if isinstance(r, RegexRule):
                 try:
-                    invoked = set(map(lambda x: self.rule_dict[x], r.invokes.split(" ")))
+                    invoked, phrases, patterns = self.index_regex(r)
 
-                    for phrase in r.vector:
-                        phrase_tuple = tuple(self.lang.parse(phrase))
-                        self.regex_phrases[phrase_tuple] = invoked
+                    for phrase_tuple in phrases:
+                        Rules.add_owner(self.phrase_owners, phrase_tuple, r.name)
+
+                    for pattern in patterns:
+                        Rules.add_owner(self.pattern_owners, pattern, r.name)
 
                 except KeyError, e:
                     print "ERROR: references unknown action rule", e
                     sys.exit(1)
 
+        for (phrase_tuple, owners) in self.phrase_owners.items():
+            self.regex_phrases[phrase_tuple] = self.owned_invoked(owners)
+
+        for (pattern, owners) in self.pattern_owners.items():
+            self.regex_patterns[pattern] = self.owned_invoked(owners)
+
+        self.phrase_matcher = fred_match.PhraseMatcher(self.regex_phrases)
+        self.pattern_matcher = fred_match.PatternMatcher(self.regex_patterns)
+
+        # 5. rule id arrays for choose_rules(), built on first use
+
+        self.batch_index = None
+
+        # 6. optional fred_stats.Stats instrumentation hook
+
+        self.stats = None
+
+        # 7. weighted candidate sets, keyed by stimulus
+
+        self.candidate_cache = fred_lru.LRUCache(Rules.candidate_cache_size)
+
+        # 8. response templates with "[]" bind points, split into the
+        # literal segments around them
+
+        self.templates = {}
+
+        for r in self.action_rules:
+            self.compile_templates(r)
+
+        # 9. optional fred_typo.TypoIndex over the phrase and fuzzy
+        # vocabulary, see enable_typos()
+
+        self.typo_index = None
+        self.typo_penalty = 0.5
+
+        # 10. the "next:" and "expect:" transitions, indexed by rule
+        # id, so a follow-up turn can skip matching
+
+        self.transitions = [None] * len(self.rule_list)
+        self.transition_deps = {}
+
+        for r in self.action_rules:
+            try:
+                self.compile_transition(r)
+            except KeyError, e:
+                print "ERROR: next references unknown action rule", e
+                sys.exit(1)
+
+
+    def __getstate__ (self):
+        # the language model, NumPy arrays, and cached candidates
+        # aren't part of a compiled rulebase
+        state = self.__dict__.copy()
+        state["lang"] = None
+        state["batch_index"] = None
+        state["stats"] = None
+        state["typo_index"] = None
+        state["candidate_cache"] = fred_lru.LRUCache(self.candidate_cache.maxsize)
+        return state
+
+
+    def clear_caches (self):
+        self.candidate_cache.clear()
+
+
+    def vocabulary (self):
+        """
+        every token in the regex phrases and fuzzy set names
+        """
+
+        words = set(self.fuzzy_sets)
+
+        for phrase in self.regex_phrases:
+            words.update(phrase)
+
+        return words
+
+
+    def enable_typos (self, max_distance=2, penalty=0.5):
+        """
+        also match stimulus tokens within max_distance edits of the
+        vocabulary, with their weights scaled by penalty
+        """
+
+        self.typo_index = fred_typo.TypoIndex(self.vocabulary(), max_distance)
+        self.typo_penalty = penalty
+        self.clear_caches()
+
+
+    def correct_stimulus (self, stimulus):
+        """
+        replace each token outside the vocabulary with its nearest
+        word, if there's one close enough; returns the corrected
+        stimulus, and the set of words substituted in
+        """
+
+        corrected = list(stimulus)
+        fixed = set()
+
+        for i in xrange(len(stimulus)):
+            words = self.typo_index.correct(stimulus[i])
+
+            if words:
+                corrected[i] = words[0]
+                fixed.add(words[0])
+
+        return tuple(corrected), fixed
+
+
+    def index_fuzzy (self, r):
+        """
+        resolve the members of a fuzzy rule, noting which rules it
+        depends on
+        """
+
+        members = tuple(map(lambda x: (self.rule_dict[r.members[x]], r.weights[x]), range(0, len(r.members))))
+
+        for name in r.members:
+            self.fuzzy_deps.setdefault(name, set()).add(r.name)
+
+        return members
+
+
+    def compile_templates (self, r):
+        """
+        split the response lines of an action rule at their bind
+        points, keyed by the (interned) line
+        """
+
+        for template in r.vector:
+            if "[]" in template:
+                self.templates[template] = tuple(template.split("[]"))
+
+
+    def index_regex (self, r):
+        """
+        resolve the rules a regex rule invokes, tokenize its literal
+        phrases and pick out its patterns, noting which rules it
+        depends on
+        """
+
+        names = r.invokes.split(" ")
+        invoked = set(map(lambda x: self.rule_dict[x], names))
+        phrases = [self.lang.tokenize(phrase) for phrase in r.vector if not Rule.is_pattern(phrase)]
+        patterns = [phrase[1:-1] for phrase in r.vector if Rule.is_pattern(phrase)]
+        self.regex_sources[r.name] = (invoked, phrases, patterns)
+
+        for name in names:
+            self.regex_deps.setdefault(name, set()).add(r.name)
+
+        return invoked, phrases, patterns
+
+
+    def compile_transition (self, r):
+        """
+        resolve the rule an action rule names as "next:" to its id,
+        along with the set of its "expect:" words; raises KeyError for
+        a name which isn't an action rule. a "next:" without "expect:"
+        words never fires, so it gets no transition
+        """
+
+        transitions = self.transitions
+
+        if r.id >= len(transitions):
+            transitions.extend([None] * (r.id + 1 - len(transitions)))
+
+        if r.next:
+            target = self.rule_dict.get(r.next)
+
+            if not isinstance(target, ActionRule):
+                raise KeyError(r.next)
+
+            expect = frozenset([intern(word) for word in r.expect if word])
+            self.transition_deps.setdefault(r.next, set()).add(r.name)
+
+            if expect:
+                transitions[r.id] = (target.id, expect)
+            else:
+                transitions[r.id] = None
+        else:
+            transitions[r.id] = None
+
+
+    def follow_transition (self, session, first):
+        """
+        return the "next:" rule of the rule which fired last in this
+        session, if any of its "expect:" words is among the stimulus
+        tokens, and it's still eligible; else None
+        """
+
+        last = session.last_rule
+
+        if last is None or last >= len(self.transitions):
+            return None
+
+        transition = self.transitions[last]
+
+        if transition is None:
+            return None
+
+        next_id, expect = transition
+
+        for word in expect:
+            if word in first:
+                break
+        else:
+            return None
+
+        rule = self.rule_list[next_id]
+
+        if rule.repeat or session.count(rule) < 1:
+            return rule
+        else:
+            return None
+
+
+    @staticmethod
+    def add_owner (owners, key, name):
+        # a lone owner is kept as its name, several as a frozenset,
+        # which never gets changed in place, so the dict can be
+        # shared with the previous Rules after a reload
+        prev = owners.get(key)
+
+        if prev is None:
+            owners[key] = name
+        elif isinstance(prev, frozenset):
+            owners[key] = prev | frozenset([name])
+        elif prev != name:
+            owners[key] = frozenset([prev, name])
+
+
+    @staticmethod
+    def remove_owner (owners, key, name):
+        prev = owners.get(key)
+
+        if prev == name:
+            del owners[key]
+        elif isinstance(prev, frozenset):
+            rest = prev - frozenset([name])
+
+            if len(rest) == 1:
+                owners[key] = iter(rest).next()
+            else:
+                owners[key] = rest
+
+
+    def owned_invoked (self, owners):
+        """
+        the rules invoked through a phrase or pattern, given its owners
+        """
+
+        if isinstance(owners, frozenset):
+            return set().union(*[self.regex_sources[name][0] for name in owners])
+        else:
+            return self.regex_sources[owners][0]
+
+
+    @staticmethod
+    def copy_deps (deps, names, copied):
+        # copy-on-write for the dependency sets shared with the
+        # previous Rules
+        for name in names:
+            if name not in copied:
+                deps[name] = set(deps.get(name, ()))
+                copied.add(name)
+
+
+    def update (self, changed, removed, changed_fuzzy, removed_fuzzy, first_action):
+        """
+        return a new Rules with the changed rules added or replaced
+        and the removed names dropped, sharing everything else with
+        this one, so that only the affected index entries get rebuilt;
+        rule ids stay stable, so existing sessions carry over
+        """
+
+        new = object.__new__(Rules)
+        new.__dict__.update(self.__dict__)
+
+        new.first_action = first_action
+        new.rule_dict = rule_dict = dict(self.rule_dict)
+        new.rule_list = rule_list = list(self.rule_list)
+        new.fuzzy_rules = dict(self.fuzzy_rules)
+        new.fuzzy_sets = dict(self.fuzzy_sets)
+        new.regex_phrases = dict(self.regex_phrases)
+        new.regex_patterns = dict(self.regex_patterns)
+        new.regex_sources = dict(self.regex_sources)
+        new.phrase_owners = dict(self.phrase_owners)
+        new.pattern_owners = dict(self.pattern_owners)
+        new.fuzzy_deps = dict(self.fuzzy_deps)
+        new.regex_deps = dict(self.regex_deps)
+        new.templates = dict(self.templates)
+        new.transitions = transitions = list(self.transitions)
+        new.transition_deps = dict(self.transition_deps)
+
+        new.batch_index = None
+        new.candidate_cache = fred_lru.LRUCache(self.candidate_cache.maxsize)
+
+        # 1. swap the rules themselves, keeping the ids of replaced
+        # rules, and appending new ones
+
+        touched = set(removed)
+
+        for name in removed:
+            old = rule_dict.pop(name, None)
+
+            if old:
+                rule_list[old.id] = None
+
+        for r in changed:
+            old = self.rule_dict.get(r.name)
+
+            if old:
+                r.id = old.id
+            else:
+                r.id = len(rule_list)
+                rule_list.append(None)
+
+            rule_dict[r.name] = r
+            rule_list[r.id] = r
+            touched.add(r.name)
+
+            if isinstance(r, ActionRule):
+                new.compile_templates(r)
+
+        new.session = new.new_session()
+
+        # 1.1 re-resolve the transitions of the changed rules, and
+        # check that no remaining rule leads to one which is gone
+
+        copied = set()
+
+        for r in changed:
+            old = self.rule_dict.get(r.name)
+
+            if isinstance(old, ActionRule) and old.next:
+                Rules.copy_deps(new.transition_deps, [old.next], copied)
+                new.transition_deps[old.next].discard(r.name)
+
+            if r.id < len(transitions):
+                transitions[r.id] = None
+
+            if isinstance(r, ActionRule):
+                if r.next:
+                    Rules.copy_deps(new.transition_deps, [r.next], copied)
+
+                try:
+                    new.compile_transition(r)
+                except KeyError, e:
+                    raise ParseError("next references unknown action rule: " + str(e))
+
+        for name in removed:
+            old = self.rule_dict.get(name)
+
+            if old is not None and old.id < len(transitions):
+                transitions[old.id] = None
+
+        for name in touched:
+            if not isinstance(rule_dict.get(name), ActionRule):
+                for source in new.transition_deps.get(name, ()):
+                    r = rule_dict.get(source)
+
+                    if isinstance(r, ActionRule) and r.next == name:
+                        raise ParseError("next references unknown action rule: " + name)
+
+        # 2. re-resolve the regex rules which changed, or which invoke
+        # a rule that changed
+
+        affected = set([name for name in touched if isinstance(self.rule_dict.get(name) or rule_dict.get(name), RegexRule)])
+
+        for name in touched:
+            affected.update(self.regex_deps.get(name, ()))
+
+        added_phrases = {}
+        removed_phrases = set()
+        touched_phrases = set()
+        touched_patterns = set()
+        copied = set()
+
+        for name in affected:
+            if name in new.regex_sources:
+                invoked, phrases, patterns = new.regex_sources.pop(name)
+
+                for phrase in phrases:
+                    Rules.remove_owner(new.phrase_owners, phrase, name)
+                    touched_phrases.add(phrase)
+
+                for pattern in patterns:
+                    Rules.remove_owner(new.pattern_owners, pattern, name)
+                    touched_patterns.add(pattern)
+
+            r = rule_dict.get(name)
+
+            if isinstance(r, RegexRule):
+                Rules.copy_deps(new.regex_deps, r.invokes.split(" "), copied)
+
+                try:
+                    invoked, phrases, patterns = new.index_regex(r)
+                except KeyError, e:
+                    raise ParseError("references unknown action rule: " + str(e))
+
+                for phrase in phrases:
+                    Rules.add_owner(new.phrase_owners, phrase, name)
+                    touched_phrases.add(phrase)
+
+                for pattern in patterns:
+                    Rules.add_owner(new.pattern_owners, pattern, name)
+                    touched_patterns.add(pattern)
+
+        # then settle each phrase and pattern by whichever rules
+        # still list it, as a full parse would
+
+        for phrase in touched_phrases:
+            owners = new.phrase_owners.get(phrase)
+
+            if owners is None:
+                if new.regex_phrases.pop(phrase, None) is not None:
+                    removed_phrases.add(phrase)
+            else:
+                new.regex_phrases[phrase] = added_phrases[phrase] = new.owned_invoked(owners)
+
+        for pattern in touched_patterns:
+            owners = new.pattern_owners.get(pattern)
+
+            if owners is None:
+                new.regex_patterns.pop(pattern, None)
+            else:
+                new.regex_patterns[pattern] = new.owned_invoked(owners)
+
+        patterns_changed = len(touched_patterns) > 0
+
+        new.phrase_matcher = self.phrase_matcher.updated(added_phrases, removed_phrases)
+
+        if new.typo_index is not None:
+            # removed words stay in the index, but match nothing
+            for phrase in added_phrases:
+                for word in phrase:
+                    new.typo_index.add(word)
+
+        if patterns_changed:
+            new.pattern_matcher = fred_match.PatternMatcher(new.regex_patterns)
+
+        # 3. re-resolve the fuzzy sets which changed, or which have a
+        # member rule that changed
+
+        affected = set(removed_fuzzy) | set([r.name for r in changed_fuzzy])
+        copied = set()
 
-    def choose_first (self):
-        return self.first_action.fire()
+        for name in touched:
+            affected.update(self.fuzzy_deps.get(name, ()))
+
+        for name in removed_fuzzy:
+            new.fuzzy_rules.pop(name, None)
+
+        for r in changed_fuzzy:
+            new.fuzzy_rules[r.name] = r
+
+            if new.typo_index is not None:
+                new.typo_index.add(r.name)
+
+        for name in affected:
+            r = new.fuzzy_rules.get(name)
+
+            if r:
+                Rules.copy_deps(new.fuzzy_deps, r.members, copied)
+
+                try:
+                    new.fuzzy_sets[name] = new.index_fuzzy(r)
+                except KeyError, e:
+                    raise ParseError("fuzzy set references unknown rule: " + str(e))
+            else:
+                new.fuzzy_sets.pop(name, None)
+
+        # 4. the action and intro rule lists, if any of those changed
+
+        kinds = [self.rule_dict.get(name) for name in removed] + changed
+
+        if any([isinstance(r, ActionRule) for r in kinds]):
+            new.action_rules = [r for r in rule_list if isinstance(r, ActionRule)]
+
+        if any([isinstance(r, IntroRule) for r in kinds]):
+            new.intro_rules = [r for r in rule_list if isinstance(r, IntroRule)]
+
+        return new
+
+
+    def new_session (self):
+        return fred_session.Session()
+
+
+    def choose_first (self, session=None):
+        if session is None:
+            session = self.session
+
+        return session.fire(self.first_action)
+
+
+    def choose_fallback (self, session):
+        """
+        when nothing matched, every eligible action rule enters the
+        union with the same weight, which makes the draw uniform over
+        the eligible rules; sample that directly instead of building
+        and ranking the full union
+        """
+
+        actions = self.action_rules
+        eligible = len(actions) - session.spent
+
+        if eligible * 4 >= len(actions):
+            # mostly eligible: rejection sampling, fewer than 4 draws
+            # expected; the draws are capped, since spent goes stale
+            # when a reload changes the repeat flag of a fired rule
+            for i in xrange(Rules.max_fallback_draws):
+                rule = actions[int(random.random() * len(actions))]
+
+                if rule.repeat or session.count(rule) < 1:
+                    return rule
+
+        candidates = [r for r in actions if r.repeat or session.count(r) < 1]
+
+        if candidates:
+            return random.choice(candidates)
+        else:
+            # every action rule has been used up
+            return random.choice(actions)
 
 
     @staticmethod
@@ -103,84 +682,406 @@ class Rules (object):
             return -1
 
 
-    def choose_rule (self, utterance):
-        stimulus = self.lang.parse(utterance)
-        fuzzy_union = fred_fuzzy.FuzzyUnion()
+    def choose_rule (self, utterance, session=None):
+        if session is None:
+            session = self.session
+
+        stats = self.stats
+
+        if stats:
+            t = stats.clock()
+
+        stimulus, first = self.lang.scan(utterance)
+
+        if stats:
+            stats.lap("tokenize", t)
+
+        return self.choose_reply(stimulus, first, session)
+
+
+    def choose_reply (self, stimulus, first, session, fuzzy_union=None):
+        """
+        select and fire a rule for a tokenized stimulus, then bind its
+        response; the weighted candidates get matched (or found in the
+        cache) unless they're given, e.g., by fred_stream.StreamMatch
+        """
+
+        stats = self.stats
+
+        if stats:
+            t = stats.clock()
 
         # 1. select an optional introduction (p <= 0.03)
 
         response = ""
 
         if random.random < 0.03:
-            response = choice(self.intro_rules).fire()
+            response = session.fire(choice(self.intro_rules))
 
         # 2. "Fred.chooseReply()"
-        # based on key words from the input stream
-        #   2.1 regex matches => invoked action rules r=200
+        # based on key words from the input stream; the same stimulus
+        # always gets the same weighted candidates, so those get cached
+        # while eligibility and the random draw still run every turn
 
-        for (phrase, rules) in self.regex_phrases.items():
-            if Rules.find_sublist(phrase, stimulus) >= 0:
-                for rule in rules:
-                    fuzzy_union.add_rule(rule, 2.0)
+        #   2.0 a follow-up to the previous rule's "next:" and
+        #   "expect:" goes straight to that rule, with no matching
 
-        #   2.2 fuzzy rules => invoked action rules
+        selected_rule = self.follow_transition(session, first)
 
-        for (fuzzy_term, members) in self.fuzzy_sets.items():
-            if fuzzy_term in stimulus:
-                for rule, weight in members:
-                    fuzzy_union.add_rule(rule, weight)
+        if selected_rule is not None:
+            weight = 1.0
 
-        #   2.3 action rules r=100
+            if stats:
+                t = stats.lap("transition", t)
+        else:
+            if fuzzy_union is None:
+                fuzzy_union = self.candidate_cache.get(stimulus)
 
-        if fuzzy_union.is_empty():
-            for rule in self.action_rules:
-                if rule.repeat or rule.count < 1:
-                    fuzzy_union.add_rule(rule, 1.0)
+                if fuzzy_union is None:
+                    fuzzy_union = self.match_candidates(stimulus, first)
 
-        # select an action rule to use for a response template
+                    if fuzzy_union.complete:
+                        self.candidate_cache.put(stimulus, fuzzy_union)
 
-        selected_rule, weight = fuzzy_union.select_rule()
-        response_template = selected_rule.fire()
+            if stats:
+                t = stats.lap("match", t)
+                stats.size("candidates", len(fuzzy_union.rule_set))
 
-        # 3. test for "bind" points in the selected response template
+            #   2.3 action rules r=100
+            # select an action rule to use for a response template
 
-        if selected_rule.bind and response_template.find("[]") > 0:
-            pos = stimulus.index(selected_rule.bind) + 1
-            fragment = stimulus[pos:]
+            if fuzzy_union.is_empty():
+                selected_rule, weight = self.choose_fallback(session), 1.0
+            else:
+                selected_rule, weight = fuzzy_union.select_rule()
 
-            # 3.1 invert the verb tense, possessives, contractions, negations...
-            # NB: some kind of context-free grammar might work better here
+        response_template = session.fire(selected_rule)
 
-            replacement = " ".join(self.lang.invert(fragment))
-            response_template = response_template.replace("[]", replacement)
+        if stats:
+            t = stats.lap("select", t)
 
-        response += response_template
+        response += self.bind_response(selected_rule, response_template, stimulus, first)
+
+        if stats:
+            t = stats.lap("bind", t)
 
         # 4. decide whether the current query differs from the
         # previous one...
 
-        # 5. "Fred.logChat()" keep track of what's been said
+        # 5. "Fred.logChat()" keep track of what's been said, see
+        # fred_log.ChatLog, which FRED.reply() feeds
 
         return response, selected_rule, weight
 
 
+    def start_match (self, session=None):
+        """
+        begin matching an utterance which arrives a few words at a
+        time, see fred_stream.StreamMatch
+        """
+
+        if session is None:
+            session = self.session
+
+        return fred_stream.StreamMatch(self, session)
+
+
+    def match_candidates (self, stimulus, first=None):
+        """
+        build the weighted candidate set for a stimulus, given the
+        first position of each of its tokens, if known; the result
+        may be shared through the cache, so treat it as read-only
+        """
+
+        stats = self.stats
+
+        if stats:
+            t = stats.clock()
+
+        fuzzy_union = fred_fuzzy.FuzzyUnion()
+
+        #   2.1 regex matches => invoked action rules r=200
+
+        phrases = self.phrase_matcher.match(stimulus)
+
+        for (phrase, rules) in phrases:
+            for rule in rules:
+                fuzzy_union.add_rule(rule, 2.0)
+
+        for (pattern, rules) in self.pattern_matcher.match(stimulus):
+            for rule in rules:
+                fuzzy_union.add_rule(rule, 2.0)
+
+        if stats:
+            t = stats.lap("phrase_match", t)
+
+        #   2.2 fuzzy rules => invoked action rules
+
+        if first is None:
+            first = set(stimulus)
+
+        for token in first:
+            members = self.fuzzy_sets.get(token)
+
+            if members:
+                fuzzy_union.add_rules(members)
+
+        if stats:
+            t = stats.lap("fuzzy_lookup", t)
+
+        #   2.2.1 misspelled tokens => the phrases and fuzzy rules of
+        #   their nearest words, at a penalty
+
+        if self.typo_index is not None:
+            corrected, fixed = self.correct_stimulus(stimulus)
+
+            if fixed:
+                penalty = self.typo_penalty
+                exact = set([phrase for (phrase, rules) in phrases])
+
+                for (phrase, rules) in self.phrase_matcher.match(corrected):
+                    if phrase not in exact:
+                        for rule in rules:
+                            fuzzy_union.add_rule(rule, 2.0 * penalty)
+
+                for word in fixed:
+                    if word not in first:
+                        for (rule, weight) in self.fuzzy_sets.get(word, ()):
+                            fuzzy_union.add_rule(rule, weight * penalty)
+
+            if stats:
+                stats.lap("typo_lookup", t)
+
+        return fuzzy_union
+
+
+    def bind_response (self, selected_rule, response_template, stimulus, first=None):
+        # 3. test for "bind" points in the selected response template
+
+        segments = self.templates.get(response_template)
+
+        if segments is None or not selected_rule.bind:
+            return response_template
+
+        if first is None:
+            first = self.lang.first_positions(stimulus)
+
+        pos = first.get(selected_rule.bind)
+
+        if pos is None:
+            # e.g., the rule got picked by the no-match fallback
+            fragment = ()
+        else:
+            fragment = stimulus[pos + 1:]
+
+        # 3.1 invert the verb tense, possessives, contractions, negations...
+        # NB: some kind of context-free grammar might work better here
+
+        return " ".join(self.lang.invert(fragment)).join(segments)
+
+
+    def build_batch_index (self):
+        """
+        rule id arrays for the phrase and fuzzy indexes, and for the
+        action rules, used by choose_rules()
+        """
+
+        if self.batch_index is None:
+            phrase_ids = {}
+
+            for (phrase, rules) in self.regex_phrases.items() + self.regex_patterns.items():
+                phrase_ids[phrase] = numpy.array(sorted([r.id for r in rules]), dtype=numpy.int64)
+
+            fuzzy_ids = {}
+
+            for (term, members) in self.fuzzy_sets.items():
+                fuzzy_ids[term] = (numpy.array([r.id for r, w in members], dtype=numpy.int64),
+                                   numpy.array([w for r, w in members], dtype=numpy.float64))
+
+            action_ids = numpy.array([r.id for r in self.action_rules], dtype=numpy.int64)
+            action_repeat = numpy.array([r.repeat for r in self.action_rules], dtype=bool)
+
+            self.batch_index = (phrase_ids, fuzzy_ids, action_ids, action_repeat)
+
+        return self.batch_index
+
+
+    def choose_rules (self, utterances, sessions=None, seed=None):
+        """
+        batch version of choose_rule() for offline replay: tokenize
+        and match every utterance, score all of the candidate sets
+        together in NumPy arrays indexed by rule id, then make the
+        selections in order; sessions, if given, runs parallel to
+        utterances (repeat a Session to replay a conversation),
+        otherwise each utterance gets a fresh session; a fixed seed
+        (or a numpy.random.RandomState) makes the results reproducible
+
+        returns a list of responses, plus arrays of the selected rule
+        ids and their weights
+        """
+
+        if numpy is None:
+            raise ImportError("choose_rules() requires NumPy")
+
+        phrase_ids, fuzzy_ids, action_ids, action_repeat = self.build_batch_index()
+        if isinstance(seed, numpy.random.RandomState):
+            rng = seed
+        else:
+            rng = numpy.random.RandomState(seed)
+
+        n_rules = len(self.rule_list)
+        n_utter = len(utterances)
+
+        # 1. tokenize and match, collecting (row, rule id, weight)
+        # triples for the whole batch
+
+        stimuli = []
+        rows, cols, vals = [], [], []
+
+        for i in xrange(n_utter):
+            stimulus, first = self.lang.scan(utterances[i])
+            stimuli.append((stimulus, first))
+
+            phrases = self.phrase_matcher.match(stimulus)
+
+            for (phrase, rules) in phrases + self.pattern_matcher.match(stimulus):
+                ids = phrase_ids[phrase]
+                rows.append(numpy.repeat(i, len(ids)))
+                cols.append(ids)
+                vals.append(numpy.repeat(2.0, len(ids)))
+
+            for token in first:
+                members = fuzzy_ids.get(token)
+
+                if members:
+                    ids, weights = members
+                    rows.append(numpy.repeat(i, len(ids)))
+                    cols.append(ids)
+                    vals.append(weights)
+
+            if self.typo_index is not None:
+                corrected, fixed = self.correct_stimulus(stimulus)
+
+                if fixed:
+                    penalty = self.typo_penalty
+                    exact = set([phrase for (phrase, rules) in phrases])
+
+                    for (phrase, rules) in self.phrase_matcher.match(corrected):
+                        if phrase not in exact:
+                            ids = phrase_ids[phrase]
+                            rows.append(numpy.repeat(i, len(ids)))
+                            cols.append(ids)
+                            vals.append(numpy.repeat(2.0 * penalty, len(ids)))
+
+                    for word in fixed:
+                        members = fuzzy_ids.get(word)
+
+                        if members and word not in first:
+                            ids, weights = members
+                            rows.append(numpy.repeat(i, len(ids)))
+                            cols.append(ids)
+                            vals.append(weights * penalty)
+
+        # 2. sum the weights per (row, rule id), then make the same
+        # exp(-2w/W) draw as FuzzyUnion.select_rule() for every row
+        # at once
+
+        selected = numpy.full(n_utter, -1, dtype=numpy.int64)
+        selected_weight = numpy.ones(n_utter, dtype=numpy.float64)
+        draws = rng.random_sample(n_utter)
+
+        if rows:
+            keys = numpy.concatenate(rows) * n_rules + numpy.concatenate(cols)
+            keys, inverse = numpy.unique(keys, return_inverse=True)
+            weight = numpy.bincount(inverse, weights=numpy.concatenate(vals))
+
+            row = keys // n_rules
+            tot_sum = numpy.bincount(row, weights=weight, minlength=n_utter)
+            exp_dist = numpy.exp(weight / tot_sum[row] * -2.0)
+            exp_sum = numpy.bincount(row, weights=exp_dist, minlength=n_utter)
+            cum_dist = numpy.cumsum(exp_dist)
+
+            starts = numpy.searchsorted(row, numpy.arange(n_utter), side="left")
+            ends = numpy.searchsorted(row, numpy.arange(n_utter), side="right")
+            matched = ends > starts
+
+            base = numpy.where(starts > 0, cum_dist[numpy.maximum(starts - 1, 0)], 0.0)
+            pick = numpy.searchsorted(cum_dist, base + draws * exp_sum)
+
+            # a draw of 0 (or one lost in rounding against base) would
+            # land on the previous row's last candidate
+            pick = numpy.minimum(numpy.maximum(pick, starts), numpy.maximum(ends - 1, 0))
+
+            selected[matched] = (keys % n_rules)[pick[matched]]
+            selected_weight[matched] = weight[pick[matched]]
+
+        # 3. fire the rules in order, since the no-match fallback
+        # depends on what each session has already used up
+
+        responses = []
+
+        for i in xrange(n_utter):
+            if sessions is None:
+                session = self.new_session()
+            else:
+                session = sessions[i]
+
+                # the previous turn of this session may lead straight
+                # to a "next:" rule
+                next_rule = self.follow_transition(session, stimuli[i][1])
+
+                if next_rule is not None:
+                    selected[i] = next_rule.id
+                    selected_weight[i] = 1.0
+
+            if selected[i] < 0:
+                fired = numpy.in1d(action_ids, numpy.fromiter(session.counts, dtype=numpy.int64, count=len(session.counts)))
+
+                eligible = action_ids[action_repeat | ~fired]
+
+                if len(eligible) == 0:
+                    eligible = action_ids
+
+                selected[i] = eligible[rng.randint(len(eligible))]
+
+            selected_rule = self.rule_list[selected[i]]
+            session.record(selected_rule)
+
+            response_template = selected_rule.vector[rng.randint(len(selected_rule.vector))]
+            stimulus, first = stimuli[i]
+            responses.append(self.bind_response(selected_rule, response_template, stimulus, first))
+
+        return responses, selected, selected_weight
+
+
 class Rule (object):
+    # slotted, so that a large rulebase doesn't pay for a dict per rule
+    __slots__ = ("name", "vector", "id")
+
     rule_pat = re.compile("(\S+)\:\s+(\S+)")
 
+    # an attribute's value runs to the end of its line, e.g., the
+    # several words of "expect:" or "invokes:"
+    attrib_pat = re.compile("(\S+)\:\s+(\S.*)")
+
     def __init__ (self):
         self.name = None
         self.vector = None
-        self.count = 0
+        self.id = None
 
     def parse (self, name, vector, attrib):
         self.name = name.lower()
-        self.vector = vector
+        self.vector = map(intern, vector)
         return self
 
     def fire (self):
-        self.count += 1
         return random.choice(self.vector)
 
+    @staticmethod
+    def is_pattern (line):
+        # a "/pattern/" line, in a regex rule
+        return len(line) > 2 and line[0] == "/" and line[-1] == "/"
+
 
     @staticmethod
     def parse_lines (rule_lines):
@@ -203,7 +1104,10 @@ class Rule (object):
         attrib = {}
 
         for line in rule_lines:
-            m = Rule.rule_pat.match(line)
+            if Rule.is_pattern(line):
+                m = None
+            else:
+                m = Rule.attrib_pat.match(line)
 
             if m:
                 (elem, value) = m.group(1).lower().strip(), m.group(2).strip()
@@ -232,47 +1136,81 @@ class Rule (object):
     
 
     @staticmethod
-    def parse_file (lang, filename):
+    def parse_file (lang, filename, compact=False):
         """
         read a JFRED rule file, return a Rules object 
         """
 
+        rule_dict, first_action, fuzzy_dict = Rule.read_file(filename)
+        return Rules(lang, rule_dict, first_action, fuzzy_dict, compact=compact)
+
+
+    @staticmethod
+    def read_file (filename):
+        """
+        read a JFRED rule file, return the parsed rules, before any
+        indexing
+        """
+
         rule_dict = {}
         first_action = None
         fuzzy_dict = {}
 
         with open(filename, "r") as f:
-            rule_lines = []
-
-            for line in f:
-                line = line.strip()
-
-                if line.startswith("#"):
-                    pass
-                elif len(line) == 0:
-                    if len(rule_lines) > 0:
-                        try:
-                            rule = Rule.parse_lines(rule_lines)
-                        except ParseError:
-                            print "ERROR: cannot parse rule description", rule_lines
-                            sys.exit(1)
-                        else:
-                            if isinstance(rule, FuzzyRule):
-                                fuzzy_dict[rule.name] = rule
-                            else:
-                                rule_dict[rule.name] = rule
-
-                                if not first_action and isinstance(rule, ActionRule):
-                                    first_action = rule
-
-                    rule_lines = []
+            for lineno, rule_lines in Rule.iter_blocks(f):
+                try:
+                    rule = Rule.parse_lines(rule_lines)
+                except ParseError:
+                    print "ERROR: cannot parse rule description", rule_lines
+                    sys.exit(1)
                 else:
-                    rule_lines.append(line)
+                    if isinstance(rule, FuzzyRule):
+                        fuzzy_dict[rule.name] = rule
+                    else:
+                        rule_dict[rule.name] = rule
 
-        return Rules(lang, rule_dict, first_action, fuzzy_dict)
+                        if not first_action and isinstance(rule, ActionRule):
+                            first_action = rule
+
+        return rule_dict, first_action, fuzzy_dict
+
+
+    @staticmethod
+    def iter_blocks (f):
+        """
+        generate the (line number, stripped lines) for each block of
+        a rule file, where blocks get separated by blank lines
+        """
+
+        rule_lines = []
+        start = 0
+        lineno = 0
+
+        for line in f:
+            lineno += 1
+            line = line.strip()
+
+            if line.startswith("#"):
+                pass
+            elif len(line) == 0:
+                if len(rule_lines) > 0:
+                    yield start, rule_lines
+
+                rule_lines = []
+            else:
+                if not rule_lines:
+                    start = lineno
+
+                rule_lines.append(line)
+
+        if len(rule_lines) > 0:
+            # the last block needn't end with a blank line
+            yield start, rule_lines
 
 
 class IntroRule (Rule):
+    __slots__ = ()
+
     def __init__ (self):
         super(IntroRule, self).__init__()
 
@@ -286,6 +1224,8 @@ class IntroRule (Rule):
 
 
 class ActionRule (Rule):
+    __slots__ = ("priority", "repeat", "requires", "expect", "bind", "next", "url")
+
     def __init__ (self):
         super(ActionRule, self).__init__()
         self.priority = 0
@@ -312,7 +1252,7 @@ class ActionRule (Rule):
             del attrib["requires"]
 
         if "expect" in attrib:
-            self.expect = attrib["expect"].lower().split(" ")
+            self.expect = attrib["expect"].lower().split()
             del attrib["expect"]
 
         if "bind" in attrib:
@@ -339,6 +1279,8 @@ class ActionRule (Rule):
 
 
 class ResponseRule (Rule):
+    __slots__ = ()
+
     def __init__ (self):
         super(ResponseRule, self).__init__()
 
@@ -352,6 +1294,8 @@ class ResponseRule (Rule):
 
 
 class RegexRule (Rule):
+    __slots__ = ("invokes",)
+
     def __init__ (self):
         super(RegexRule, self).__init__()
         self.invokes = None
@@ -360,12 +1304,19 @@ class RegexRule (Rule):
         super(RegexRule, self).parse(name, vector, attrib)
 
         if "invokes" in attrib:
-            self.invokes = attrib["invokes"].lower()
+            self.invokes = " ".join(attrib["invokes"].lower().split())
             del attrib["invokes"]
 
         if not self.invokes:
             raise ParseError("regex rule must invoke: " + name)
 
+        for line in self.vector:
+            if Rule.is_pattern(line):
+                try:
+                    re.compile(line[1:-1])
+                except re.error, e:
+                    raise ParseError("bad pattern %s: %s" % (line, e))
+
         if len(attrib) > 0:
             raise ParseError("unrecognized rule element: " + str(attrib))
 
@@ -373,9 +1324,11 @@ class RegexRule (Rule):
 
 
 class FuzzyRule (Rule):
+    __slots__ = ("weights", "members")
+
     def __init__ (self):
         super(FuzzyRule, self).__init__()
-        self.weights = []
+        self.weights = array.array("d")
         self.members = []
 
     def parse (self, name, vector, attrib):
@@ -388,17 +1341,17 @@ class FuzzyRule (Rule):
             weight, rule = line.split("\t")
             weight = float(int(weight))
 
-            self.members.append(rule.lower())
+            self.members.append(intern(rule.lower()))
             self.weights.append(weight)
 
         sum_weight = sum(self.weights)
-        self.weights = map(lambda x: x / sum_weight, self.weights)
+        self.weights = array.array("d", [x / sum_weight for x in self.weights])
         self.vector = []
 
         return self
 
 
 if __name__=='__main__':
-    rule_dict, first_action = Rule.parse_file(sys.argv[1])
+    rule_dict, first_action, fuzzy_dict = Rule.read_file(sys.argv[1])
     print len(rule_dict)
     print first_action
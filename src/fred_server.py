@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import asynchat
+import asyncore
+import errno
+import gc
+import os
+import signal
+import socket
+import time
+
+
+######################################################################
+## event-driven server classes
+## one process, one event loop, many concurrent conversations
+######################################################################
+
+class ChatChannel (asynchat.async_chat):
+    # stop reading from a client while this many bytes of responses
+    # wait to be sent, so a client which pipelines lines without
+    # reading the replies gets held back by TCP flow control
+    max_output_size = 65536
+
+    def __init__ (self, server, sock, address):
+        asynchat.async_chat.__init__(self, sock=sock, map=server.socket_map)
+        self.server = server
+        self.address = address
+        self.buffer = []
+        self.buffer_size = 0
+        self.output_size = 0
+        self.closing = False
+        self.last_active = time.time()
+        self.session = server.fred.rules.new_session()
+
+        self.set_terminator("\n")
+        self.prompt(server.fred.rules.choose_first(self.session))
+
+
+    def prompt (self, response):
+        self.push(response + "\n> ")
+
+
+    def push (self, data):
+        self.output_size += len(data)
+        asynchat.async_chat.push(self, data)
+
+
+    def send (self, data):
+        num_sent = asynchat.async_chat.send(self, data)
+        self.output_size -= num_sent
+        return num_sent
+
+
+    def readable (self):
+        return self.output_size <= self.max_output_size
+
+
+    def collect_incoming_data (self, data):
+        if self.closing:
+            return
+
+        self.last_active = time.time()
+        self.buffer_size += len(data)
+
+        if self.buffer_size > self.server.max_line_size:
+            # keep reading, but drop the rest of the input, and close
+            # once the error gets sent
+            self.closing = True
+            self.buffer = []
+            self.push("ERROR: line too long\n")
+            self.close_when_done()
+        else:
+            self.buffer.append(data)
+
+
+    def found_terminator (self):
+        if self.closing:
+            return
+
+        self.last_active = time.time()
+
+        utterance = "".join(self.buffer).rstrip("\r")
+        self.buffer = []
+        self.buffer_size = 0
+
+        response, self.session = self.server.fred.respond(utterance, self.session)
+        self.prompt(response)
+
+
+    def handle_close (self):
+        self.server.channels.discard(self)
+        self.close()
+
+
+class ChatServer (asyncore.dispatcher):
+    max_line_size = 1024
+
+    def __init__ (self, fred, port, host='', backlog=128, max_conn=1000, idle_timeout=300.0, sock=None):
+        self.socket_map = {}
+        asyncore.dispatcher.__init__(self, map=self.socket_map)
+
+        self.fred = fred
+        self.max_conn = max_conn
+        self.idle_timeout = idle_timeout
+        self.channels = set()
+
+        if sock:
+            # share a socket which is already listening
+            sock.setblocking(0)
+            self.set_socket(sock)
+            self.accepting = True
+        else:
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.set_reuse_addr()
+            self.bind((host, port))
+            self.listen(backlog)
+
+
+    def handle_accept (self):
+        pair = self.accept()
+
+        if pair is None:
+            return
+
+        sock, address = pair
+
+        if len(self.channels) >= self.max_conn:
+            # over the connection limit, turn the client away
+            try:
+                sock.send("ERROR: server busy\n")
+            except socket.error:
+                pass
+
+            sock.close()
+        else:
+            self.channels.add(ChatChannel(self, sock, address))
+
+
+    def reap_idle (self):
+        """
+        close the connections which have been idle too long
+        """
+
+        cutoff = time.time() - self.idle_timeout
+
+        for channel in [c for c in self.channels if c.last_active < cutoff]:
+            self.channels.discard(channel)
+            channel.close()
+
+
+    def serve_forever (self, poll_interval=1.0):
+        """
+        run the event loop, using poll() so that the connection count
+        isn't capped by FD_SETSIZE
+        """
+
+        while self.socket_map:
+            asyncore.loop(timeout=poll_interval, use_poll=True, map=self.socket_map, count=1)
+            self.reap_idle()
+            self.fred.check_reload()
+
+
+class PreforkServer (object):
+    """
+    load and index the rulebase once, bind the listening socket, then
+    fork worker processes which each run a ChatServer on that socket;
+    the rule data gets shared copy-on-write, and the parent process
+    restarts any worker which dies
+    """
+
+    # a worker which dies sooner than this gets restarted after a pause
+    min_uptime = 1.0
+
+    def __init__ (self, fred, port, workers, host='', backlog=128, max_conn=1000, idle_timeout=300.0):
+        self.fred = fred
+        self.port = port
+        self.host = host
+        self.num_workers = workers
+        self.backlog = backlog
+        self.max_conn = max_conn
+        self.idle_timeout = idle_timeout
+
+        self.workers = {}
+        self.running = False
+
+
+    def spawn (self, sock):
+        pid = os.fork()
+
+        if pid:
+            self.workers[pid] = time.time()
+            return
+
+        # in the worker
+        status = 0
+
+        try:
+            # exit through the finally clause, to flush the log
+            signal.signal(signal.SIGTERM, self.exit_worker)
+            signal.signal(signal.SIGINT, self.exit_worker)
+
+            server = ChatServer(self.fred, self.port, max_conn=self.max_conn, idle_timeout=self.idle_timeout, sock=sock)
+            server.serve_forever()
+        except Exception, e:
+            print "ERROR: worker", os.getpid(), e
+            status = 1
+        finally:
+            if self.fred.chat_log:
+                self.fred.chat_log.close()
+
+            if self.fred.sessions:
+                self.fred.sessions.close()
+
+            os._exit(status)
+
+
+    @staticmethod
+    def exit_worker (signum, frame):
+        raise SystemExit(0)
+
+
+    def stop (self, signum, frame):
+        self.running = False
+
+
+    def serve_forever (self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(self.backlog)
+
+        # clean up the heap before forking, so the workers start out
+        # sharing as many pages as possible
+        gc.collect()
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.running = True
+
+        for i in xrange(self.num_workers):
+            self.spawn(sock)
+
+        while self.running:
+            try:
+                pid, status = os.wait()
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+
+            started = self.workers.pop(pid, None)
+
+            if started is not None and self.running:
+                print "worker", pid, "exited with status", status, "restarting"
+
+                if time.time() - started < PreforkServer.min_uptime:
+                    time.sleep(PreforkServer.min_uptime)
+
+                self.spawn(sock)
+
+        for pid in self.workers.keys():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+        for pid in self.workers.keys():
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+
+        sock.close()
+
+
+if __name__=='__main__':
+    print ChatServer
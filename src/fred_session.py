@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##     http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import itertools
+
+
+######################################################################
+## conversation state
+## everything which changes during one conversation lives here, so
+## that the compiled Rules can be shared read-only across sessions
+######################################################################
+
+class Session (object):
+    __slots__ = ("id", "key", "counts", "spent", "last_rule", "next", "expect")
+
+    max_count = 255
+    ids = itertools.count(1)
+
+    def __init__ (self):
+        # identifies the conversation in the log
+        self.id = next(Session.ids)
+
+        # names a conversation which persists across connections
+        self.key = None
+
+        # fire counts of the rules fired so far, by rule id,
+        # saturating at max_count; the size grows with the
+        # conversation, not with the rulebase
+        self.counts = {}
+
+        # number of non-repeat action rules already used up
+        self.spent = 0
+
+        self.last_rule = None
+        self.next = None
+        self.expect = None
+
+
+    def count (self, rule):
+        return self.counts.get(rule.id, 0)
+
+
+    def fire (self, rule):
+        """
+        record that the rule fired in this session, then return one
+        of its responses
+        """
+
+        self.record(rule)
+        return rule.fire()
+
+
+    def record (self, rule):
+        """
+        update the fire count and context for a rule
+        """
+
+        count = self.counts.get(rule.id, 0)
+
+        if count == 0 and getattr(rule, "repeat", True) is False:
+            self.spent += 1
+
+        if count < Session.max_count:
+            self.counts[rule.id] = count + 1
+
+        self.last_rule = rule.id
+        self.next = getattr(rule, "next", None)
+        self.expect = getattr(rule, "expect", None) or None
+
+
+if __name__=='__main__':
+    session = Session()
+    print session.counts, session.last_rule
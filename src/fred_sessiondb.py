@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_lru
+import fred_session
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+######################################################################
+## persistent sessions
+## conversations which identify themselves by key get their state
+## (fire counts by rule name, last rule, pending next/expect) kept in
+## SQLite; a background thread writes the sessions changed since its
+## last pass in one transaction, sessions get loaded lazily when their
+## key comes back, and only the most recently used ones stay in memory
+######################################################################
+
+class SessionStore (object):
+    """
+    forked workers each open their own connections to the same file;
+    two workers holding the same key at once means the last write wins
+    """
+
+    insert = "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?)"
+
+    def __init__ (self, path, rules, cache_size=100000, flush_interval=1.0):
+        self.path = path
+        self.rules = rules
+        self.flush_interval = flush_interval
+
+        self.cache = fred_lru.LRUCache(cache_size)
+        self.dirty = {}
+        self.lock = threading.Lock()
+
+        self.loaded = 0
+        self.created = 0
+        self.written = 0
+        self.errors = 0
+
+        self.pid = None
+        self.db = None
+        self.thread = None
+        self.stopping = None
+
+        db = self.connect()
+        db.execute("CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, updated REAL, last_rule TEXT, next TEXT, expect TEXT, counts TEXT)")
+        db.commit()
+        db.close()
+
+
+    def connect (self):
+        db = sqlite3.connect(self.path, timeout=30.0)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+
+    def start (self):
+        """
+        open this process's connection and start its writer thread;
+        neither survives a fork, so each worker starts its own
+        """
+
+        self.pid = os.getpid()
+        self.cache.clear()
+        self.dirty = {}
+        self.db = self.connect()
+
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="fred-sessions")
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def get (self, key):
+        """
+        return the session for a key: from memory, or else from the
+        database, or else a new one
+        """
+
+        if self.pid != os.getpid():
+            self.start()
+
+        session = self.cache.get(key)
+
+        if session is None:
+            with self.lock:
+                # evicted, but not written yet
+                session = self.dirty.get(key)
+
+            if session is None:
+                session = self.load(key)
+
+            self.cache.put(key, session)
+
+        return session
+
+
+    def load (self, key):
+        session = self.rules.new_session()
+        session.key = key
+
+        row = self.db.execute("SELECT last_rule, next, expect, counts FROM sessions WHERE key = ?", (key,)).fetchone()
+
+        if row is None:
+            self.created += 1
+            return session
+
+        last_rule, session.next, expect, counts = row
+
+        if expect:
+            session.expect = expect.split(" ")
+        rule_dict = self.rules.rule_dict
+
+        # rule ids may differ since the session got written, the
+        # rule names don't
+        for (name, count) in json.loads(counts).items():
+            rule = rule_dict.get(name)
+
+            if rule is not None:
+                session.counts[rule.id] = min(count, fred_session.Session.max_count)
+
+                if getattr(rule, "repeat", True) is False:
+                    session.spent += 1
+
+        if last_rule in rule_dict:
+            session.last_rule = rule_dict[last_rule].id
+
+        self.loaded += 1
+        return session
+
+
+    def touch (self, session):
+        """
+        mark a session as changed by a turn; it gets written on the
+        writer's next pass
+        """
+
+        with self.lock:
+            self.dirty[session.key] = session
+
+
+    def row (self, session, now):
+        rule_list = self.rules.rule_list
+        counts = {}
+
+        # a copy, since the session may fire another rule meanwhile
+        for (i, count) in session.counts.items():
+            rule = rule_list[i] if i < len(rule_list) else None
+
+            if rule is not None:
+                counts[rule.name] = count
+
+        last_rule = session.last_rule
+
+        if last_rule is not None and last_rule < len(rule_list) and rule_list[last_rule] is not None:
+            last_rule = rule_list[last_rule].name
+        else:
+            last_rule = None
+
+        if session.expect:
+            expect = " ".join(session.expect)
+        else:
+            expect = None
+
+        return (session.key, now, last_rule, session.next, expect, json.dumps(counts))
+
+
+    def flush (self, db):
+        with self.lock:
+            batch, self.dirty = self.dirty, {}
+
+        if not batch:
+            return
+
+        now = time.time()
+        rows = []
+
+        for session in batch.values():
+            try:
+                rows.append(self.row(session, now))
+            except (TypeError, ValueError), e:
+                self.error(session.key, e)
+
+        try:
+            with db:
+                db.executemany(SessionStore.insert, rows)
+
+            self.written += len(rows)
+        except sqlite3.Error:
+            # find the rows at fault, so the others still get written
+            for row in rows:
+                try:
+                    with db:
+                        db.execute(SessionStore.insert, row)
+
+                    self.written += 1
+                except sqlite3.OperationalError, e:
+                    # e.g., the database is locked: try again on the
+                    # next pass, unless changed meanwhile
+                    self.error(row[0], e)
+
+                    with self.lock:
+                        self.dirty.setdefault(row[0], batch[row[0]])
+                except sqlite3.Error, e:
+                    # this session's data can't be written, ever
+                    self.error(row[0], e)
+
+
+    def error (self, key, e):
+        self.errors += 1
+
+        if self.errors == 1:
+            print "ERROR: cannot write sessions", self.path, key, e
+
+
+    def run (self):
+        db = self.connect()
+
+        try:
+            while not self.stopping.wait(self.flush_interval):
+                self.flush(db)
+
+            self.flush(db)
+        finally:
+            db.close()
+
+
+    def close (self, timeout=30.0):
+        """
+        write whatever changed, then stop the writer
+        """
+
+        if self.thread is not None and self.pid == os.getpid():
+            self.stopping.set()
+            self.thread.join(timeout)
+            self.thread = None
+
+            self.db.close()
+            self.db = None
+
+
+    def info (self):
+        return { "cached": len(self.cache), "dirty": len(self.dirty), "loaded": self.loaded, "created": self.created,
+                 "written": self.written, "errors": self.errors }
+
+
+if __name__=='__main__':
+    import fred_lang
+    import fred_rules
+    import sys
+
+    if len(sys.argv) < 3:
+        ## CLI error, show usage
+        sys.exit("usage:\n  %s rule_file db_file [key]" % sys.argv[0])
+
+    rules = fred_rules.Rule.parse_file(fred_lang.Language(), sys.argv[1])
+    store = SessionStore(sys.argv[2], rules)
+    session = store.get(sys.argv[3] if len(sys.argv) > 3 else "test")
+
+    print rules.choose_rule("hello", session)[0]
+    store.touch(session)
+    store.close()
+    print store.info()
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_fuzzy
+import fred_lang
+import fred_match
+import fred_rules
+
+import asynchat
+import asyncore
+import json
+import os
+import socket
+import subprocess
+import sys
+import zlib
+
+
+######################################################################
+## sharding
+## the regex phrases, patterns and fuzzy sets get partitioned by
+## keyword across shard processes, each indexing only its own slice;
+## a router tokenizes once, scatters the stimulus to every shard over
+## a line-framed JSON socket protocol, and gathers their partial
+## weights into one FuzzyUnion before selection
+######################################################################
+
+def shard_of (key, num_shards):
+    """
+    stable owner of a keyword, the same in every process
+    """
+
+    return (zlib.crc32(key) & 0xffffffff) % num_shards
+
+
+class ShardIndex (object):
+    def __init__ (self, lang, rule_dict, fuzzy_dict, shard, num_shards):
+        """
+        index the slice of the phrases, patterns and fuzzy sets owned
+        by this shard; phrases go by their first token, fuzzy sets by
+        their term
+        """
+
+        self.shard = shard
+        self.num_shards = num_shards
+
+        phrases = {}
+        patterns = {}
+        self.fuzzy_sets = {}
+
+        for r in rule_dict.values():
+            if isinstance(r, fred_rules.RegexRule):
+                names = tuple(sorted(set(r.invokes.split(" "))))
+
+                for name in names:
+                    if name not in rule_dict:
+                        raise fred_rules.ParseError("regex rule '%s' references unknown action rule '%s'" % (r.name, name))
+
+                # a phrase which several rules list invokes all of them
+                for line in r.vector:
+                    if fred_rules.Rule.is_pattern(line):
+                        if shard_of(line, num_shards) == shard:
+                            patterns[line[1:-1]] = tuple(sorted(set(patterns.get(line[1:-1], ())) | set(names)))
+                    else:
+                        phrase = lang.tokenize(line)
+
+                        if shard_of(phrase[0] if phrase else "", num_shards) == shard:
+                            phrases[phrase] = tuple(sorted(set(phrases.get(phrase, ())) | set(names)))
+
+        for (term, r) in fuzzy_dict.items():
+            if shard_of(term, num_shards) == shard:
+                for name in r.members:
+                    if name not in rule_dict:
+                        raise fred_rules.ParseError("fuzzy set '%s' references unknown rule '%s'" % (term, name))
+
+                self.fuzzy_sets[term] = tuple(zip(r.members, r.weights))
+
+        self.phrase_matcher = fred_match.PhraseMatcher(phrases)
+        self.pattern_matcher = fred_match.PatternMatcher(patterns)
+
+
+    def match (self, tokens):
+        """
+        partial candidate weights for a stimulus, keyed by rule name
+        """
+
+        weights = {}
+
+        for (phrase, names) in self.phrase_matcher.match(tokens) + self.pattern_matcher.match(tokens):
+            for name in names:
+                weights[name] = weights.get(name, 0.0) + 2.0
+
+        for token in set(tokens):
+            for (name, weight) in self.fuzzy_sets.get(token, ()):
+                weights[name] = weights.get(name, 0.0) + weight
+
+        return weights
+
+
+######################################################################
+## shard server
+######################################################################
+
+class ShardChannel (asynchat.async_chat):
+    max_line_size = 65536
+
+    def __init__ (self, server, sock):
+        asynchat.async_chat.__init__(self, sock=sock, map=server.socket_map)
+        self.server = server
+        self.buffer = []
+        self.buffer_size = 0
+        self.closing = False
+        self.set_terminator("\n")
+
+
+    def collect_incoming_data (self, data):
+        if self.closing:
+            return
+
+        self.buffer_size += len(data)
+
+        if self.buffer_size > ShardChannel.max_line_size:
+            # one error, then drop the rest of the input until closed
+            self.closing = True
+            self.buffer = []
+            self.push(json.dumps({ "error": "request too long" }) + "\n")
+            self.close_when_done()
+        else:
+            self.buffer.append(data)
+
+
+    def found_terminator (self):
+        if self.closing:
+            return
+
+        line = "".join(self.buffer)
+        self.buffer = []
+        self.buffer_size = 0
+
+        try:
+            tokens = tuple(json.loads(line)["tokens"])
+            reply = { "weights": self.server.index.match(tokens).items() }
+        except (ValueError, KeyError, TypeError), e:
+            reply = { "error": str(e) }
+
+        self.push(json.dumps(reply) + "\n")
+
+
+class ShardServer (asyncore.dispatcher):
+    def __init__ (self, index, port, host="127.0.0.1", backlog=128):
+        self.socket_map = {}
+        asyncore.dispatcher.__init__(self, map=self.socket_map)
+
+        self.index = index
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind((host, port))
+        self.listen(backlog)
+        self.port = self.socket.getsockname()[1]
+
+
+    def handle_accept (self):
+        pair = self.accept()
+
+        if pair is not None:
+            sock, address = pair
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            ShardChannel(self, sock)
+
+
+    def serve_forever (self):
+        asyncore.loop(timeout=1.0, use_poll=True, map=self.socket_map)
+
+
+######################################################################
+## router side
+######################################################################
+
+class ShardClient (object):
+    """
+    persistent connections to every shard; each request goes out to
+    all of them before any reply gets read, so the shards work on it
+    in parallel
+    """
+
+    def __init__ (self, addresses, timeout=5.0):
+        self.addresses = addresses
+        self.timeout = timeout
+        self.conns = [None] * len(addresses)
+        self.pid = os.getpid()
+
+
+    def connect (self, i):
+        sock = socket.create_connection(self.addresses[i], self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.conns[i] = (sock, sock.makefile("rb"))
+        return self.conns[i]
+
+
+    def drop (self, i):
+        sock, f = self.conns[i]
+        self.conns[i] = None
+        f.close()
+        sock.close()
+
+
+    def match (self, tokens):
+        """
+        gather the (rule name, weight) pairs from every shard, and
+        whether every shard answered; a shard which fails gets
+        reported, reconnected on the next turn, and contributes nothing
+        meanwhile
+        """
+
+        if self.pid != os.getpid():
+            # forked workers need connections of their own
+            self.conns = [None] * len(self.addresses)
+            self.pid = os.getpid()
+
+        request = json.dumps({ "tokens": list(tokens) }) + "\n"
+        sent = []
+        weights = []
+        answered = 0
+
+        for i in xrange(len(self.addresses)):
+            try:
+                sock, f = self.conns[i] or self.connect(i)
+                sock.sendall(request)
+                sent.append(i)
+            except (socket.error, IOError), e:
+                print "ERROR: shard", self.addresses[i], e
+
+                if self.conns[i]:
+                    self.drop(i)
+
+        for i in sent:
+            sock, f = self.conns[i]
+
+            try:
+                line = f.readline()
+
+                if not line:
+                    raise IOError("connection closed")
+
+                reply = json.loads(line)
+
+                if "error" in reply:
+                    print "ERROR: shard", self.addresses[i], reply["error"]
+                else:
+                    weights.extend(reply["weights"])
+                    answered += 1
+            except (socket.error, IOError, ValueError), e:
+                print "ERROR: shard", self.addresses[i], e
+                self.drop(i)
+
+        return weights, answered == len(self.addresses)
+
+
+    def close (self):
+        for i in xrange(len(self.conns)):
+            if self.conns[i]:
+                self.drop(i)
+
+
+class ShardedRules (fred_rules.Rules):
+    """
+    Rules whose phrase and fuzzy indexes live in the shards; sessions,
+    selection and binding stay local
+    """
+
+    def __init__ (self, lang, rule_dict, first_action, shards):
+        # the regex and fuzzy rules are only needed by the shards
+        local = dict([(name, r) for (name, r) in rule_dict.items() if not isinstance(r, fred_rules.RegexRule)])
+        super(ShardedRules, self).__init__(lang, local, first_action, {})
+        self.shards = shards
+
+
+    def __getstate__ (self):
+        raise TypeError("sharded rules can't be compiled")
+
+
+    def match_candidates (self, stimulus, first=None):
+        stats = self.stats
+
+        if stats:
+            t = stats.clock()
+
+        fuzzy_union = fred_fuzzy.FuzzyUnion()
+        weights, fuzzy_union.complete = self.shards.match(stimulus)
+
+        for (name, weight) in weights:
+            rule = self.rule_dict.get(name)
+
+            if rule:
+                fuzzy_union.add_rule(rule, weight)
+
+        if stats:
+            stats.lap("shard_match", t)
+
+        return fuzzy_union
+
+
+    def choose_rules (self, utterances, sessions=None, seed=None):
+        raise TypeError("sharded rules can't run choose_rules(), which needs the local indexes")
+
+
+    def start_match (self, session=None):
+        raise TypeError("sharded rules can't run start_match(), which needs the local indexes")
+
+
+    def update (self, changed, removed, changed_fuzzy, removed_fuzzy, first_action):
+        raise TypeError("sharded rules can't be reloaded")
+
+
+######################################################################
+## local shard processes
+######################################################################
+
+def spawn_shards (rule_file, num_shards, host="127.0.0.1"):
+    """
+    start one shard process per slice, which all build their indexes
+    in parallel; returns the processes and their addresses, once
+    every one of them is listening
+    """
+
+    script = os.path.abspath(__file__)
+    procs = []
+    addresses = []
+
+    for shard in xrange(num_shards):
+        procs.append(subprocess.Popen([sys.executable, script, rule_file, str(shard), str(num_shards), "0", host],
+                                      stdout=subprocess.PIPE))
+
+    for proc in procs:
+        # each shard reports its port once it's ready
+        line = proc.stdout.readline()
+
+        if not line.startswith("listening"):
+            for p in procs:
+                p.terminate()
+
+            raise IOError("shard failed to start: " + rule_file)
+
+        addresses.append((host, int(line.split()[1])))
+
+    return procs, addresses
+
+
+def load_sharded (lang, rule_file, shards):
+    """
+    load the router side of a sharded rulebase, given a ShardClient
+    """
+
+    rule_dict, first_action, fuzzy_dict = fred_rules.Rule.read_file(rule_file)
+    return ShardedRules(lang, rule_dict, first_action, shards)
+
+
+if __name__=='__main__':
+    if len(sys.argv) < 5:
+        ## CLI error, show usage
+        sys.exit("usage:\n  %s rule_file shard num_shards port [host]" % sys.argv[0])
+
+    rule_file, shard, num_shards, port = sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])
+    host = sys.argv[5] if len(sys.argv) > 5 else "127.0.0.1"
+
+    rule_dict, first_action, fuzzy_dict = fred_rules.Rule.read_file(rule_file)
+
+    try:
+        index = ShardIndex(fred_lang.Language(), rule_dict, fuzzy_dict, shard, num_shards)
+    except fred_rules.ParseError, e:
+        sys.exit("ERROR: %s" % e)
+
+    server = ShardServer(index, port, host=host)
+
+    print "listening", server.port
+    sys.stdout.flush()
+
+    server.serve_forever()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import timeit
+
+
+######################################################################
+## instrumentation
+## per-stage latency and candidate-set size histograms, cheap enough
+## to leave running in production
+######################################################################
+
+class Histogram (object):
+    """
+    power-of-two buckets: bucket i counts the values in [2^(i-1), 2^i)
+    """
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    num_buckets = 40
+
+    def __init__ (self):
+        self.buckets = [0] * Histogram.num_buckets
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add (self, value):
+        value = int(value)
+        self.buckets[min(value.bit_length(), Histogram.num_buckets - 1)] += 1
+        self.count += 1
+        self.total += value
+
+        if value > self.max:
+            self.max = value
+
+
+    def percentile (self, p):
+        """
+        upper bound of the bucket which holds the p-th percentile
+        """
+
+        if not self.count:
+            return 0
+
+        rank = p / 100.0 * self.count
+        seen = 0
+
+        for i in xrange(Histogram.num_buckets):
+            seen += self.buckets[i]
+
+            if seen >= rank:
+                return min((1 << i) - 1, self.max)
+
+        return self.max
+
+
+    def summary (self):
+        mean = float(self.total) / self.count if self.count else 0.0
+
+        return { "count": self.count,
+                 "mean": round(mean, 1),
+                 "p50": self.percentile(50),
+                 "p95": self.percentile(95),
+                 "p99": self.percentile(99),
+                 "max": self.max
+                 }
+
+
+class Stats (object):
+    clock = staticmethod(timeit.default_timer)
+
+    def __init__ (self):
+        self.timings = {}
+        self.sizes = {}
+
+
+    def lap (self, stage, start):
+        """
+        record the microseconds since start against stage, and
+        return the time now, to start the next stage
+        """
+
+        now = Stats.clock()
+        hist = self.timings.get(stage)
+
+        if hist is None:
+            hist = self.timings[stage] = Histogram()
+
+        hist.add((now - start) * 1e6)
+        return now
+
+
+    def size (self, name, n):
+        hist = self.sizes.get(name)
+
+        if hist is None:
+            hist = self.sizes[name] = Histogram()
+
+        hist.add(n)
+
+
+    def report (self):
+        return { "timings_us": dict([(k, h.summary()) for k, h in self.timings.items()]),
+                 "sizes": dict([(k, h.summary()) for k, h in self.sizes.items()])
+                 }
+
+
+    def format (self):
+        lines = []
+
+        for (title, hists) in [("us", self.timings), ("n", self.sizes)]:
+            for name in sorted(hists):
+                s = hists[name].summary()
+                lines.append("%-16s %-2s count %d mean %s p50 %d p95 %d p99 %d max %d" %
+                             (name, title, s["count"], s["mean"], s["p50"], s["p95"], s["p99"], s["max"]))
+
+        return "\n".join(lines)
+
+
+if __name__=='__main__':
+    stats = Stats()
+    t = Stats.clock()
+
+    for i in xrange(1000):
+        t = stats.lap("noop", t)
+
+    print stats.format()
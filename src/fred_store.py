@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_rules
+
+import array
+import random
+import sys
+
+
+######################################################################
+## compact rule storage
+## rules kept in columns, as parallel arrays indexed by rule id, with
+## the response text packed into one interned blob; the Rule API stays
+## available through lightweight views
+######################################################################
+
+NONE = -1
+
+
+class RuleStore (object):
+    def __init__ (self, rules):
+        """
+        build the columns from a sequence of rules indexed by rule id
+        """
+
+        self.kind = array.array("B")
+        self.priority = array.array("i")
+        self.repeat = array.array("B")
+        self.names = []
+
+        # attribute strings, as indexes into one interned table
+        self.strings = []
+        self.bind = array.array("i")
+        self.next = array.array("i")
+        self.expect = array.array("i")
+        self.requires = array.array("i")
+        self.url = array.array("i")
+        self.invokes = array.array("i")
+
+        # rule id => [vec_offsets[id], vec_offsets[id + 1]) in
+        # vec_texts, which index the unique lines in text_blob
+        self.vec_offsets = array.array("I", [0])
+        self.vec_texts = array.array("I")
+        self.text_offsets = array.array("I", [0])
+
+        string_ids = {}
+        text_ids = {}
+        blob = []
+
+        def string_id (value):
+            if value is None:
+                return NONE
+
+            i = string_ids.get(value)
+
+            if i is None:
+                i = string_ids[value] = len(self.strings)
+                self.strings.append(intern(value))
+
+            return i
+
+        for rule in rules:
+            self.kind.append(RuleStore.kind_of(rule))
+            self.names.append(intern(rule.name))
+            self.priority.append(getattr(rule, "priority", 0))
+            self.repeat.append(int(getattr(rule, "repeat", False)))
+
+            self.bind.append(string_id(getattr(rule, "bind", None)))
+            self.next.append(string_id(getattr(rule, "next", None)))
+            self.expect.append(string_id(" ".join(getattr(rule, "expect", [])) or None))
+            self.requires.append(string_id(getattr(rule, "requires", None)))
+            self.url.append(string_id(getattr(rule, "url", None)))
+            self.invokes.append(string_id(getattr(rule, "invokes", None)))
+
+            for text in rule.vector:
+                i = text_ids.get(text)
+
+                if i is None:
+                    i = text_ids[text] = len(text_ids)
+                    blob.append(text)
+                    self.text_offsets.append(self.text_offsets[-1] + len(text))
+
+                self.vec_texts.append(i)
+
+            self.vec_offsets.append(len(self.vec_texts))
+
+        self.text_blob = "".join(blob)
+        self.views = [VIEW_CLASSES[self.kind[i]](self, i) for i in xrange(len(self.names))]
+
+
+    @staticmethod
+    def kind_of (rule):
+        for cls in type(rule).__mro__:
+            if cls in KIND_INDEX:
+                return KIND_INDEX[cls]
+
+        raise fred_rules.ParseError("cannot store rule: " + rule.name)
+
+
+    def string (self, i):
+        if i == NONE:
+            return None
+        else:
+            return self.strings[i]
+
+
+    def text (self, i):
+        return self.text_blob[self.text_offsets[i]:self.text_offsets[i + 1]]
+
+
+    def vector (self, rule_id):
+        return [self.text(i) for i in self.vec_texts[self.vec_offsets[rule_id]:self.vec_offsets[rule_id + 1]]]
+
+
+    def random_text (self, rule_id):
+        return self.text(self.vec_texts[random.randrange(self.vec_offsets[rule_id], self.vec_offsets[rule_id + 1])])
+
+
+    def nbytes (self):
+        """
+        approximate memory held by the columns, the string tables, and
+        the views
+        """
+
+        total = len(self.text_blob)
+
+        for column in [self.kind, self.priority, self.repeat, self.bind, self.next, self.expect,
+                       self.requires, self.url, self.invokes, self.vec_offsets, self.vec_texts, self.text_offsets]:
+            total += column.itemsize * len(column)
+
+        for table in [self.names, self.strings]:
+            total += sys.getsizeof(table) + sum([sys.getsizeof(s) for s in table])
+
+        total += sys.getsizeof(self.views) + sum([sys.getsizeof(v) for v in self.views])
+
+        return total
+
+
+######################################################################
+## views
+######################################################################
+
+class RuleView (object):
+    """
+    mixed into the slotted rule classes, so each view holds just its
+    store and id, with no dict; its properties shadow the rule's own
+    slots, which stay empty
+    """
+
+    __slots__ = ()
+
+    def __init__ (self, store, rule_id):
+        self.store = store
+        self.id = rule_id
+
+    def __getstate__ (self):
+        # the default would collect the properties, as if slots
+        return (self.store, self.id)
+
+    def __setstate__ (self, state):
+        self.store, self.id = state
+
+    name = property(lambda self: self.store.names[self.id])
+    vector = property(lambda self: self.store.vector(self.id))
+
+    def fire (self):
+        return self.store.random_text(self.id)
+
+
+class IntroView (RuleView, fred_rules.IntroRule):
+    __slots__ = ("store",)
+
+
+class ActionView (RuleView, fred_rules.ActionRule):
+    __slots__ = ("store",)
+
+    priority = property(lambda self: self.store.priority[self.id])
+    repeat = property(lambda self: bool(self.store.repeat[self.id]))
+    bind = property(lambda self: self.store.string(self.store.bind[self.id]))
+    next = property(lambda self: self.store.string(self.store.next[self.id]))
+    requires = property(lambda self: self.store.string(self.store.requires[self.id]))
+    url = property(lambda self: self.store.string(self.store.url[self.id]))
+
+    @property
+    def expect (self):
+        value = self.store.string(self.store.expect[self.id])
+
+        if value is None:
+            return []
+        else:
+            return value.split(" ")
+
+
+class ResponseView (RuleView, fred_rules.ResponseRule):
+    __slots__ = ("store",)
+
+
+class RegexView (RuleView, fred_rules.RegexRule):
+    __slots__ = ("store",)
+
+    invokes = property(lambda self: self.store.string(self.store.invokes[self.id]))
+
+
+VIEW_CLASSES = [IntroView, ActionView, ResponseView, RegexView]
+
+KIND_INDEX = { fred_rules.IntroRule: 0,
+               fred_rules.ActionRule: 1,
+               fred_rules.ResponseRule: 2,
+               fred_rules.RegexRule: 3
+               }
+
+
+if __name__=='__main__':
+    rule = fred_rules.ActionRule().parse("hello", ["Hi!", "Hello."], { "repeat": "true" })
+    store = RuleStore([rule])
+    view = store.views[0]
+    print view.name, view.vector, view.repeat, view.bind, view.fire(), store.nbytes()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_fuzzy
+
+import sys
+
+
+######################################################################
+## streaming match
+## the words of an utterance get matched as they arrive, e.g., while
+## the user is still typing: each one advances the phrase automaton
+## and adds its fuzzy sets to the candidates, so that once the
+## utterance is complete, choosing a reply needs no more matching
+######################################################################
+
+class StreamMatch (object):
+    def __init__ (self, rules, session):
+        self.rules = rules
+        self.session = session
+
+        self.stimulus = []
+        self.first = {}
+        self.fuzzy_union = fred_fuzzy.FuzzyUnion()
+
+        self.phrases = rules.phrase_matcher.scanner()
+        self.exact = set()
+
+        # the typo-corrected stream of tokens, matched alongside, with
+        # what it contributed at a penalty, in case the exact stream
+        # turns up the same later
+        if rules.typo_index is not None:
+            self.corrected = rules.phrase_matcher.scanner()
+        else:
+            self.corrected = None
+
+        self.typo_phrases = {}
+        self.typo_words = set()
+
+
+    def feed (self, text):
+        """
+        add one or more whole words, in order; splitting an utterance
+        anywhere between its words gives the same tokens
+        """
+
+        for token in self.rules.lang.tokenize(text):
+            self.feed_token(token)
+
+
+    def feed_token (self, token):
+        rules = self.rules
+        fuzzy_union = self.fuzzy_union
+        stats = rules.stats
+
+        if stats:
+            t = stats.clock()
+
+        position = len(self.stimulus)
+        self.stimulus.append(token)
+
+        #   2.1 regex matches => invoked action rules r=200
+
+        for (phrase, invoked) in self.phrases.feed(token):
+            self.exact.add(phrase)
+
+            if phrase in self.typo_phrases:
+                # no longer a match only through a corrected word
+                for rule in self.typo_phrases.pop(phrase):
+                    fuzzy_union.add_rule(rule, -2.0 * rules.typo_penalty)
+
+            for rule in invoked:
+                fuzzy_union.add_rule(rule, 2.0)
+
+        #   2.2 fuzzy rules => invoked action rules
+
+        if token not in self.first:
+            self.first[token] = position
+            members = rules.fuzzy_sets.get(token)
+
+            if members:
+                fuzzy_union.add_rules(members)
+
+                if token in self.typo_words:
+                    self.typo_words.discard(token)
+
+                    for (rule, weight) in members:
+                        fuzzy_union.add_rule(rule, -weight * rules.typo_penalty)
+
+        #   2.2.1 misspelled tokens => the phrases and fuzzy rules of
+        #   their nearest words, at a penalty
+
+        if self.corrected is not None:
+            self.feed_typo(token)
+
+        if stats:
+            stats.lap("stream_feed", t)
+
+
+    def feed_typo (self, token):
+        rules = self.rules
+        fuzzy_union = self.fuzzy_union
+        penalty = rules.typo_penalty
+
+        words = rules.typo_index.correct(token)
+        word = words[0] if words else token
+
+        for (phrase, invoked) in self.corrected.feed(word):
+            if phrase not in self.exact:
+                self.typo_phrases[phrase] = invoked
+
+                for rule in invoked:
+                    fuzzy_union.add_rule(rule, 2.0 * penalty)
+
+        if words and word not in self.first and word not in self.typo_words:
+            self.typo_words.add(word)
+
+            for (rule, weight) in rules.fuzzy_sets.get(word, ()):
+                fuzzy_union.add_rule(rule, weight * penalty)
+
+
+    def candidates (self):
+        """
+        the weighted candidates so far; the "/pattern/" regexes only
+        get applied here, since they may span the whole utterance
+        """
+
+        stimulus = tuple(self.stimulus)
+        fuzzy_union = self.fuzzy_union
+        patterns = self.rules.pattern_matcher.match(stimulus)
+
+        if patterns:
+            # leave the running union as it was, for more words
+            fuzzy_union = fred_fuzzy.FuzzyUnion()
+            fuzzy_union.rule_set = dict([(name, list(entry)) for (name, entry) in self.fuzzy_union.rule_set.items()])
+
+            for (pattern, invoked) in patterns:
+                for rule in invoked:
+                    fuzzy_union.add_rule(rule, 2.0)
+
+        return stimulus, fuzzy_union
+
+
+    def finish (self):
+        """
+        choose the reply to the utterance fed so far, as choose_rule()
+        would have; returns (response, rule, weight)
+        """
+
+        stimulus, fuzzy_union = self.candidates()
+        return self.rules.choose_reply(stimulus, self.first, self.session, fuzzy_union)
+
+
+if __name__=='__main__':
+    import fred_lang
+    import fred_rules
+
+    if len(sys.argv) < 2:
+        ## CLI error, show usage
+        sys.exit("usage:\n  %s rule_file [utterance]" % sys.argv[0])
+
+    rules = fred_rules.Rule.parse_file(fred_lang.Language(), sys.argv[1])
+    stream = rules.start_match()
+
+    for word in (" ".join(sys.argv[2:]) or "hi there what is your name").split():
+        stream.feed(word)
+        print word, sorted([(name, weight) for (name, (rule, weight)) in stream.fuzzy_union.rule_set.items()])
+
+    print stream.finish()
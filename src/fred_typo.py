@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_lru
+
+import sys
+
+
+######################################################################
+## typo tolerance
+## a SymSpell-style index: every word in the rulebase vocabulary gets
+## filed under each string reachable by deleting up to max_distance of
+## its characters, so the candidates for a misspelled token are found
+## by deleting from the token too, then checked by edit distance
+######################################################################
+
+def edit_distance (a, b, limit):
+    """
+    optimal string alignment distance, i.e., Levenshtein plus adjacent
+    transpositions; gives up with limit + 1 once it's beyond limit
+    """
+
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    # only the middle, between any common prefix and suffix, counts
+
+    n = min(len(a), len(b))
+    start = 0
+
+    while start < n and a[start] == b[start]:
+        start += 1
+
+    suffix = 0
+
+    while suffix < n - start and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+
+    a = a[start:len(a) - suffix]
+    b = b[start:len(b) - suffix]
+
+    if not a or not b:
+        return max(len(a), len(b))
+
+    if limit == 1:
+        # the common case, once a close word has turned up
+        if len(a) == 1 and len(b) == 1:
+            return 1
+        elif len(a) == 2 and len(b) == 2 and a[0] == b[1] and a[1] == b[0]:
+            return 1
+        else:
+            return 2
+
+    prev2 = None
+    prev = range(len(b) + 1)
+
+    for i in xrange(1, len(a) + 1):
+        row = [i] + [0] * len(b)
+        best = i
+
+        for j in xrange(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            d = min(prev[j] + 1, row[j - 1] + 1, prev[j - 1] + cost)
+
+            if cost and prev2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d = min(d, prev2[j - 2] + 1)
+
+            row[j] = d
+
+            if d < best:
+                best = d
+
+        if best > limit:
+            return limit + 1
+
+        prev2, prev = prev, row
+
+    return prev[-1]
+
+
+class TypoIndex (object):
+    # only the first prefix_length characters get indexed, which
+    # bounds the number of deletes per word
+    prefix_length = 7
+
+    def __init__ (self, words, max_distance=2, cache_size=4096):
+        self.max_distance = max_distance
+        self.words = set()
+        self.deletes = {}
+        self.cache = fred_lru.LRUCache(cache_size)
+
+        for word in words:
+            self.add(word)
+
+
+    def edits (self, word, distance):
+        """
+        generate the strings reachable by deleting 0, 1, ... distance
+        characters from the prefix of word, one set per count
+        """
+
+        frontier = set([word[:TypoIndex.prefix_length]])
+        seen = set(frontier)
+        yield frontier
+
+        for d in xrange(distance):
+            next_frontier = set()
+
+            for s in frontier:
+                if len(s) > 1:
+                    for i in xrange(len(s)):
+                        next_frontier.add(s[:i] + s[i + 1:])
+
+            next_frontier -= seen
+            seen |= next_frontier
+            frontier = next_frontier
+            yield frontier
+
+
+    def add (self, word):
+        if word in self.words:
+            return
+
+        self.words.add(word)
+        self.cache.clear()
+
+        for s in set().union(*self.edits(word, self.max_distance)):
+            entry = self.deletes.get(s)
+
+            # most deletes belong to one word, so those skip the list
+            if entry is None:
+                self.deletes[s] = word
+            elif isinstance(entry, list):
+                entry.append(word)
+            else:
+                self.deletes[s] = [entry, word]
+
+
+    def allowed_distance (self, token):
+        # one edit per three characters, so short words don't turn
+        # into arbitrary other short words
+        return min(self.max_distance, len(token) // 3)
+
+
+    def correct (self, token):
+        """
+        return the vocabulary words nearest to a token which isn't in
+        the vocabulary, as a tuple, sorted; empty if none is close
+        """
+
+        result = self.cache.get(token)
+
+        if result is not None:
+            return result
+
+        limit = self.allowed_distance(token)
+        result = ()
+
+        if limit > 0 and token not in self.words:
+            best = limit + 1
+            nearest = []
+            seen = set()
+
+            for (depth, level) in enumerate(self.edits(token, limit)):
+                # a word within distance d shares a string with the
+                # token after at most d deletes from each, so once
+                # past the best distance, nothing nearer is left
+                if depth > best:
+                    break
+
+                for s in level:
+                    entry = self.deletes.get(s)
+
+                    if entry is None:
+                        continue
+
+                    for word in (entry if isinstance(entry, list) else (entry,)):
+                        if word in seen:
+                            continue
+
+                        seen.add(word)
+                        d = edit_distance(token, word, min(best, limit))
+
+                        if d < best:
+                            best = d
+                            nearest = [word]
+                        elif d == best and d <= limit:
+                            nearest.append(word)
+
+            result = tuple(sorted(nearest))
+
+        self.cache.put(token, result)
+        return result
+
+
+if __name__=='__main__':
+    index = TypoIndex(["what", "is", "your", "name", "weather", "whether"])
+
+    for token in (sys.argv[1:] or ["waht", "yuor", "naem", "wether", "xyz"]):
+        print token, index.correct(token)
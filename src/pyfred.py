@@ -18,27 +18,166 @@
 
 
 import fred_client
+import fred_compile
 import fred_lang
+import fred_load
+import fred_log
+import fred_reload
 import fred_rules
+import fred_sessiondb
+import fred_shard
+import fred_stats
 
+import argparse
+import os
 import random
+import signal
 import sys
 
 
+def parse_args (argv):
+    parser = argparse.ArgumentParser(usage="%(prog)s rule_file [port] [options]")
+    parser.add_argument("rule_file")
+    parser.add_argument("port", type=int, nargs="?", default=None)
+
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="worker processes for parsing a directory of rule files")
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+                        help="always parse the rule file, ignoring its compiled cache")
+    parser.add_argument("--compact", action="store_true",
+                        help="keep the rules in columnar storage, to save memory on large rulebases")
+    parser.add_argument("--typos", type=int, default=0, metavar="DISTANCE",
+                        help="also match words within this many edits (1 or 2) of the rulebase vocabulary")
+    parser.add_argument("--typo-penalty", type=float, default=0.5,
+                        help="weight multiplier for matches through a corrected word")
+    parser.add_argument("--sessions", default=None, metavar="DB_FILE",
+                        help="keep the conversations of clients which send '/session KEY' in this SQLite file")
+    parser.add_argument("--session-cache", type=int, default=100000,
+                        help="most sessions to hold in memory")
+    parser.add_argument("--session-flush", type=float, default=1.0,
+                        help="seconds between background writes of changed sessions")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="partition the phrase and fuzzy indexes across this many local shard processes")
+    parser.add_argument("--shard-hosts", default=None, metavar="HOST:PORT,...",
+                        help="use shards already running, started by fred_shard.py")
+    parser.add_argument("--async", dest="async_mode", action="store_true",
+                        help="serve concurrent connections from one event loop")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="fork this many event-loop worker processes, sharing one rulebase")
+    parser.add_argument("--backlog", type=int, default=128,
+                        help="listen() backlog for the TCP socket")
+    parser.add_argument("--max-conn", type=int, default=1000,
+                        help="maximum number of simultaneous connections")
+    parser.add_argument("--idle-timeout", type=float, default=300.0,
+                        help="seconds before an idle connection gets closed")
+    parser.add_argument("--watch", action="store_true",
+                        help="reload the rule file whenever it changes")
+    parser.add_argument("--watch-interval", type=float, default=2.0,
+                        help="seconds between checks of the rule file")
+    parser.add_argument("--log", default=None, metavar="LOG_FILE",
+                        help="write each turn of every conversation to a rotated log, from a background thread")
+    parser.add_argument("--log-max-bytes", type=int, default=64 << 20,
+                        help="rotate the log once it reaches this size")
+    parser.add_argument("--log-backups", type=int, default=5,
+                        help="number of rotated logs to keep")
+    parser.add_argument("--log-queue", type=int, default=10000,
+                        help="records to buffer for the log writer, before dropping")
+    parser.add_argument("--stats", action="store_true",
+                        help="record per-stage latency histograms, shown by the /stats command")
+    parser.add_argument("--stats-interval", type=float, default=60.0,
+                        help="seconds between stats dumps from a chat")
+
+    return parser.parse_args(argv)
+
+
 if __name__=='__main__':
     if len(sys.argv) < 2:
         ## CLI error, show usage
         sys.exit("usage:\n  %s rule_file [port]" % sys.argv[0])
 
+    args = parse_args(sys.argv[1:])
+
     random.seed()
     lang = fred_lang.Language()
-    rules = fred_rules.Rule.parse_file(lang, sys.argv[1])
-    fred = fred_client.FRED(rules)
 
-    if len(sys.argv) < 3:
-        ## test from CLI
-        fred.chat(fred_client.Convo())
+    shard_procs = []
+
+    if args.shards > 0 or args.shard_hosts:
+        if os.path.isdir(args.rule_file) or args.watch or args.compact or args.typos > 0:
+            sys.exit("sharding needs a single rule file, without --watch, --compact, or --typos")
+
+        if args.shard_hosts:
+            addresses = []
+
+            for address in args.shard_hosts.split(","):
+                host, port = address.rsplit(":", 1)
+                addresses.append((host, int(port)))
+        else:
+            shard_procs, addresses = fred_shard.spawn_shards(args.rule_file, args.shards)
+
+        rules = fred_shard.load_sharded(lang, args.rule_file, fred_shard.ShardClient(addresses))
+    elif os.path.isdir(args.rule_file):
+        if args.watch:
+            sys.exit("--watch needs a single rule file")
+
+        try:
+            rules = fred_load.load_rules(lang, [args.rule_file], processes=args.jobs, compact=args.compact)
+        except fred_rules.ParseError, e:
+            for error in e.value:
+                print "ERROR:", error
+
+            sys.exit(1)
+    elif args.use_cache:
+        rules = fred_compile.load_rules(lang, args.rule_file, compact=args.compact)
+    else:
+        rules = fred_rules.Rule.parse_file(lang, args.rule_file, compact=args.compact)
+
+    if args.stats:
+        rules.stats = fred_stats.Stats()
+
+    if args.typos > 0:
+        rules.enable_typos(max_distance=args.typos, penalty=args.typo_penalty)
+
+    if args.watch:
+        reloader = fred_reload.RuleReloader(args.rule_file, rules, interval=args.watch_interval)
+    else:
+        reloader = None
+
+    if args.log:
+        chat_log = fred_log.ChatLog(args.log, max_bytes=args.log_max_bytes, backups=args.log_backups, max_queue=args.log_queue)
+    else:
+        chat_log = None
+
+    if args.sessions:
+        sessions = fred_sessiondb.SessionStore(args.sessions, rules, cache_size=args.session_cache, flush_interval=args.session_flush)
     else:
-        ## connect through TCP socket
-        port = int(sys.argv[2])
-        fred.chat_tcp(port)
+        sessions = None
+
+    fred = fred_client.FRED(rules, stats_interval=args.stats_interval, reloader=reloader, chat_log=chat_log, sessions=sessions)
+
+    # unwind through the finally below, which flushes the log and the
+    # sessions, and stops the shards
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        if args.port is None:
+            ## test from CLI
+            fred.chat(fred_client.Convo())
+        elif args.workers > 0:
+            ## pre-fork worker processes, each with its own event loop
+            fred.chat_prefork(args.port, args.workers, backlog=args.backlog, max_conn=args.max_conn, idle_timeout=args.idle_timeout)
+        elif args.async_mode:
+            ## serve many connections through one event loop
+            fred.chat_async(args.port, backlog=args.backlog, max_conn=args.max_conn, idle_timeout=args.idle_timeout)
+        else:
+            ## connect through TCP socket
+            fred.chat_tcp(args.port)
+    finally:
+        if chat_log:
+            chat_log.close()
+
+        if sessions:
+            sessions.close()
+
+        for proc in shard_procs:
+            proc.terminate()
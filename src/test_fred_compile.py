@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_compile
+import fred_lang
+import test_fred_reload
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+
+######################################################################
+## compiled cache tests
+## a damaged cache must read as stale, never crash or load garbage
+######################################################################
+
+class CacheTest (unittest.TestCase):
+    def setUp (self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "test.rules")
+        self.lang = fred_lang.Language()
+
+        rand = random.Random(5)
+        words = ["w%d" % i for i in xrange(50)]
+        blocks = []
+
+        for i in xrange(20):
+            blocks.append("action: a%d\nResponse %d.\n" % (i, i))
+            blocks.append("regex: r%d\ninvokes: a%d\n%s\n" % (i, i, " ".join(rand.sample(words, 2))))
+            blocks.append("fuzzy: %s\n%d\ta%d\n" % (words[i], 1 + i % 5, i))
+
+        with open(self.filename, "w") as f:
+            f.write("\n".join(blocks))
+
+        self.cache_file = fred_compile.cache_path(self.filename)
+        self.rules = fred_compile.compile_file(self.lang, self.filename)
+        self.signature = test_fred_reload.signature(self.rules)
+
+        with open(self.cache_file, "rb") as f:
+            self.data = f.read()
+
+
+    def tearDown (self):
+        shutil.rmtree(self.dir)
+
+
+    def read (self, data):
+        with open(self.cache_file, "wb") as f:
+            f.write(data)
+
+        return fred_compile.read_cache(self.lang, self.filename, self.cache_file)
+
+
+    def test_intact (self):
+        rules = self.read(self.data)
+        self.assertEqual(test_fred_reload.signature(rules), self.signature)
+
+
+    def test_compact (self):
+        rules = fred_compile.compile_file(self.lang, self.filename, compact=True)
+        cached = fred_compile.read_cache(self.lang, self.filename, self.cache_file, compact=True)
+
+        self.assertEqual(test_fred_reload.signature(cached), test_fred_reload.signature(rules))
+        self.assertEqual([(r.name, r.vector) for r in cached.rule_list], [(r.name, r.vector) for r in rules.rule_list])
+
+
+    def test_damaged (self):
+        rand = random.Random(11)
+
+        for trial in xrange(200):
+            data = bytearray(self.data)
+
+            if trial % 2:
+                del data[rand.randint(0, len(data) - 1):]
+            else:
+                i = rand.randint(0, len(data) - 1)
+                data[i] ^= 1 << rand.randint(0, 7)
+
+            rules = self.read(str(data))
+
+            if rules is not None:
+                self.assertEqual(test_fred_reload.signature(rules), self.signature)
+
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_lang
+import fred_lru
+
+import cPickle
+import random
+import sys
+import threading
+import unittest
+
+
+######################################################################
+## LRU cache tests
+## one cache shared by many threads must stay bounded and consistent
+######################################################################
+
+def hammer (num_threads, target):
+    """
+    run target(rand) on several threads at once, switching between
+    them as often as the interpreter allows; returns their exceptions
+    """
+
+    errors = []
+    interval = sys.getcheckinterval()
+
+    def run (seed):
+        try:
+            target(random.Random(seed))
+        except Exception, e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(seed,)) for seed in xrange(num_threads)]
+    sys.setcheckinterval(1)
+
+    try:
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setcheckinterval(interval)
+
+    return errors
+
+
+def check_links (cache):
+    """
+    walk the linked list both ways, against the table
+    """
+
+    keys = []
+    node = cache.root[fred_lru.NEXT]
+
+    while node is not cache.root:
+        assert node[fred_lru.NEXT][fred_lru.PREV] is node
+        keys.append(node[fred_lru.KEY])
+        node = node[fred_lru.NEXT]
+
+    return sorted(keys) == sorted(cache.table) and len(keys) <= cache.maxsize
+
+
+class LRUCacheTest (unittest.TestCase):
+    def test_eviction (self):
+        cache = fred_lru.LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertFalse("b" in cache)
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+
+
+    def test_pickle (self):
+        cache = fred_lru.LRUCache(8)
+        cache.put("a", 1)
+        copy = cPickle.loads(cPickle.dumps(cache, cPickle.HIGHEST_PROTOCOL))
+
+        self.assertEqual((copy.maxsize, len(copy)), (8, 0))
+        copy.put("b", 2)
+        self.assertEqual(copy.get("b"), 2)
+
+
+    def test_concurrent (self):
+        cache = fred_lru.LRUCache(16)
+
+        def target (rand):
+            for i in xrange(5000):
+                key = rand.randint(0, 40)
+
+                if cache.get(key) is None:
+                    cache.put(key, i)
+
+        self.assertEqual(hammer(8, target), [])
+        self.assertTrue(check_links(cache))
+
+
+    def test_concurrent_scan (self):
+        lang = fred_lang.Language(cache_size=8)
+        utterances = ["utterance number %d" % i for i in xrange(30)]
+
+        def target (rand):
+            for i in xrange(3000):
+                utterance = rand.choice(utterances)
+                assert lang.scan(utterance)[0] == tuple(utterance.split())
+
+        self.assertEqual(hammer(8, target), [])
+        self.assertTrue(check_links(lang.cache))
+
+
+if __name__=='__main__':
+    unittest.main()
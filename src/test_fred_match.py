@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_match
+import fred_rules
+
+import random
+import unittest
+
+
+######################################################################
+## phrase matcher parity tests
+## the automaton must find exactly the phrases which find_sublist()
+## finds, whether matched at once, token by token, or through edits
+######################################################################
+
+def random_phrases (rand, words, count):
+    phrases = {}
+
+    for i in xrange(count):
+        phrases[tuple([rand.choice(words) for j in xrange(rand.randint(0, 4))])] = i
+
+    return phrases
+
+
+def random_tokens (rand, words):
+    return tuple([rand.choice(words) for i in xrange(rand.randint(0, 9))])
+
+
+def expected (phrases, tokens):
+    return sorted([(phrase, value) for (phrase, value) in phrases.items()
+                   if fred_rules.Rules.find_sublist(phrase, tokens) >= 0])
+
+
+class PhraseMatcherTest (unittest.TestCase):
+    # a small vocabulary, so that phrases overlap and repeat a lot
+    words = ["a", "b", "c", "d", "e"]
+
+    def test_match (self):
+        rand = random.Random(1)
+
+        for trial in xrange(3000):
+            phrases = random_phrases(rand, self.words, rand.randint(0, 12))
+            matcher = fred_match.PhraseMatcher(phrases)
+            tokens = random_tokens(rand, self.words)
+
+            self.assertEqual(sorted(matcher.match(tokens)), expected(phrases, tokens))
+
+
+    def test_scanner (self):
+        rand = random.Random(2)
+
+        for trial in xrange(2000):
+            phrases = random_phrases(rand, self.words, rand.randint(0, 12))
+            scanner = fred_match.PhraseMatcher(phrases).scanner()
+            tokens = random_tokens(rand, self.words)
+            found = []
+
+            for token in tokens:
+                found.extend(scanner.feed(token))
+
+            self.assertEqual(sorted(found), expected(phrases, tokens))
+
+
+    def test_updated (self):
+        rand = random.Random(3)
+        min_rebuild = fred_match.PhraseMatcher.min_rebuild
+
+        try:
+            # small enough that some chains of edits force a rebuild
+            fred_match.PhraseMatcher.min_rebuild = 4
+
+            for trial in xrange(500):
+                phrases = random_phrases(rand, self.words, rand.randint(0, 12))
+                matcher = fred_match.PhraseMatcher(phrases)
+
+                for edit in xrange(rand.randint(1, 4)):
+                    added = random_phrases(rand, self.words, rand.randint(0, 3))
+                    removed = rand.sample(phrases.keys(), min(len(phrases), rand.randint(0, 3)))
+
+                    for phrase in removed:
+                        del phrases[phrase]
+
+                    phrases.update(added)
+                    matcher = matcher.updated(added, removed)
+
+                    tokens = random_tokens(rand, self.words)
+                    self.assertEqual(sorted(matcher.match(tokens)), expected(phrases, tokens))
+
+                    scanner = matcher.scanner()
+                    found = []
+
+                    for token in tokens:
+                        found.extend(scanner.feed(token))
+
+                    self.assertEqual(sorted(found), expected(phrases, tokens))
+        finally:
+            fred_match.PhraseMatcher.min_rebuild = min_rebuild
+
+
+if __name__=='__main__':
+    unittest.main()
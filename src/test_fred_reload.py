@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_lang
+import fred_reload
+import fred_rules
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+
+######################################################################
+## reload regression tests
+## a Rules derived through update() must index the same as one parsed
+## from scratch out of the same file
+######################################################################
+
+def rule_text (kind, name, lines, attrib=None):
+    head = ["%s: %s" % (kind, name)]
+
+    for (elem, value) in sorted((attrib or {}).items()):
+        head.append("%s: %s" % (elem, value))
+
+    return "\n".join(head + lines) + "\n"
+
+
+def signature (rules):
+    """
+    everything the indexes say, by rule name rather than object
+    """
+
+    def names (invoked):
+        return tuple(sorted([r.name for r in invoked]))
+
+    phrases = dict([(phrase, names(invoked)) for (phrase, invoked) in rules.regex_phrases.items()])
+    patterns = dict([(pattern, names(invoked)) for (pattern, invoked) in rules.regex_patterns.items()])
+    fuzzy = dict([(term, tuple(sorted([(r.name, w) for (r, w) in members]))) for (term, members) in rules.fuzzy_sets.items()])
+    matched = dict([(phrase, tuple(sorted([names(invoked) for (p, invoked) in rules.phrase_matcher.match(phrase)])))
+                    for phrase in rules.regex_phrases])
+
+    transitions = {}
+
+    for r in rules.rule_list:
+        if r is not None and r.id < len(rules.transitions) and rules.transitions[r.id]:
+            next_id, expect = rules.transitions[r.id]
+            transitions[r.name] = (rules.rule_list[next_id].name, tuple(sorted(expect)))
+
+    return { "phrases": phrases,
+             "patterns": patterns,
+             "fuzzy": fuzzy,
+             "matched": matched,
+             "transitions": transitions,
+             "actions": sorted([r.name for r in rules.action_rules]),
+             "intros": sorted([r.name for r in rules.intro_rules])
+             }
+
+
+class ReloadTest (unittest.TestCase):
+    def setUp (self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "test.rules")
+        self.lang = fred_lang.Language()
+
+
+    def tearDown (self):
+        shutil.rmtree(self.dir)
+
+
+    def write (self, blocks):
+        with open(self.filename, "w") as f:
+            f.write("\n".join(blocks))
+
+        # make sure the reloader sees a new stamp
+        st = os.stat(self.filename)
+        os.utime(self.filename, (st.st_atime, st.st_mtime + 1))
+
+
+    def check_reload (self, before, after):
+        self.write(before)
+        rules = fred_rules.Rule.parse_file(self.lang, self.filename)
+        reloader = fred_reload.RuleReloader(self.filename, rules)
+
+        self.write(after)
+        reloaded = reloader.reload()
+        fresh = fred_rules.Rule.parse_file(self.lang, self.filename)
+
+        self.assertEqual(signature(reloaded), signature(fresh))
+        return reloaded
+
+
+    def test_shared_phrase_dropped_by_one_rule (self):
+        actions = [rule_text("action", "a1", ["One."]), rule_text("action", "a2", ["Two."])]
+        before = actions + [rule_text("regex", "r1", ["shared phrase", "only one"], { "invokes": "a1" }),
+                            rule_text("regex", "r2", ["shared phrase"], { "invokes": "a2" })]
+
+        for edited in ("r1", "r2"):
+            after = [b for b in before if not b.startswith("regex: " + edited)]
+            after.append(rule_text("regex", edited, ["something else"], { "invokes": edited.replace("r", "a") }))
+
+            rules = self.check_reload(before, after)
+            matched = rules.phrase_matcher.match(("shared", "phrase"))
+            self.assertEqual(len(matched), 1)
+
+
+    def test_random_edits (self):
+        rand = random.Random(7)
+        words = ["w%d" % i for i in xrange(12)]
+
+        def rulebase ():
+            blocks = []
+            actions = ["a%d" % i for i in xrange(6)]
+
+            for name in actions:
+                attrib = {}
+
+                if rand.random() < 0.3:
+                    attrib = { "next": rand.choice(actions), "expect": "yes no" }
+
+                blocks.append(rule_text("action", name, ["Response %s." % name], attrib))
+
+            for i in xrange(8):
+                phrases = [" ".join(rand.sample(words, rand.randint(1, 2))) for j in xrange(rand.randint(1, 4))]
+
+                if rand.random() < 0.3:
+                    phrases.append("/%s (%s|%s)/" % tuple(rand.sample(words, 3)))
+
+                invokes = " ".join(rand.sample(actions, rand.randint(1, 2)))
+                blocks.append(rule_text("regex", "r%d" % i, phrases, { "invokes": invokes }))
+
+            for word in rand.sample(words, 4):
+                members = ["%d\t%s" % (rand.randint(1, 5), name) for name in rand.sample(actions, 2)]
+                blocks.append(rule_text("fuzzy", word, members))
+
+            return blocks
+
+        for trial in xrange(30):
+            before = rulebase()
+            after = [b for b in before if rand.random() < 0.8] + [b for b in rulebase() if rand.random() < 0.3]
+
+            # keep one rule per name, and the actions the others need
+            seen = {}
+
+            for b in after:
+                seen.setdefault(b.split("\n")[0], b)
+
+            after = [b for b in before if b.startswith("action:")] + [b for b in seen.values() if not b.startswith("action:")]
+            self.check_reload(before, after)
+
+
+if __name__=='__main__':
+    unittest.main()
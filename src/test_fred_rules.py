@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_lang
+import fred_lru
+import fred_rules
+import test_fred_lru
+
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+
+
+######################################################################
+## rule parsing and "next:"/"expect:" transition tests
+######################################################################
+
+class TransitionTest (unittest.TestCase):
+    def setUp (self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "test.rules")
+        self.lang = fred_lang.Language()
+
+
+    def tearDown (self):
+        shutil.rmtree(self.dir)
+
+
+    def parse (self, text):
+        with open(self.filename, "w") as f:
+            f.write(text)
+
+        return fred_rules.Rule.parse_file(self.lang, self.filename)
+
+
+    def follow (self, rules, name, utterance):
+        session = rules.new_session()
+        session.last_rule = rules.rule_dict[name].id
+        stimulus, first = self.lang.scan(utterance)
+        return rules.follow_transition(session, first)
+
+
+    def test_multi_word_values (self):
+        rule = fred_rules.Rule.parse_lines(["action: ask",
+                                            "next: food",
+                                            "expect: yes  sure no",
+                                            "Hungry?"])
+
+        self.assertEqual(rule.next, "food")
+        self.assertEqual(rule.expect, ["yes", "sure", "no"])
+        self.assertEqual(rule.vector, ["Hungry?"])
+
+        rule = fred_rules.Rule.parse_lines(["regex: r1",
+                                            "invokes: a1 a2",
+                                            "some phrase"])
+
+        self.assertEqual(rule.invokes, "a1 a2")
+
+
+    def test_next_without_expect (self):
+        rules = self.parse("action: ask\nnext: food\nHungry?\n\n"
+                           "action: food\nHave some pie.\n")
+
+        self.assertEqual(rules.transitions[rules.rule_dict["ask"].id], None)
+        self.assertEqual(self.follow(rules, "ask", "yes please"), None)
+        self.assertEqual(self.follow(rules, "ask", "what about the weather"), None)
+
+
+    def test_next_with_expect (self):
+        rules = self.parse("action: ask\nnext: food\nexpect: yes sure\nHungry?\n\n"
+                           "action: food\nHave some pie.\n")
+
+        self.assertEqual(self.follow(rules, "ask", "yes please").name, "food")
+        self.assertEqual(self.follow(rules, "ask", "what about the weather"), None)
+
+
+    def test_next_names_no_action (self):
+        # the load reports it and exits
+        with self.assertRaises(SystemExit):
+            self.parse("action: ask\nnext: nowhere\nHungry?\n")
+
+
+
+class SharedRulesTest (unittest.TestCase):
+    def test_concurrent_sessions (self):
+        """
+        one Rules serves many sessions from several threads, through
+        its shared scan and candidate caches
+        """
+
+        words = ["w%d" % i for i in xrange(40)]
+        blocks = []
+
+        for (i, word) in enumerate(words):
+            blocks.append("action: a%d\nrepeat: true\nResponse %d.\n" % (i, i))
+            blocks.append("regex: r%d\ninvokes: a%d\n%s\n" % (i, i, word))
+
+        tmp = tempfile.mkdtemp()
+
+        try:
+            filename = os.path.join(tmp, "test.rules")
+
+            with open(filename, "w") as f:
+                f.write("\n".join(blocks))
+
+            lang = fred_lang.Language(cache_size=8)
+            rules = fred_rules.Rule.parse_file(lang, filename)
+        finally:
+            shutil.rmtree(tmp)
+
+        rules.candidate_cache = fred_lru.LRUCache(8)
+
+        def target (rand):
+            session = rules.new_session()
+
+            for i in xrange(2000):
+                word = rand.choice(words)
+                responses, selected, weight = rules.choose_rule(word, session)
+                assert selected.name == "a" + word[1:]
+
+        self.assertEqual(test_fred_lru.hammer(8, target), [])
+        self.assertTrue(test_fred_lru.check_links(rules.candidate_cache))
+        self.assertTrue(test_fred_lru.check_links(lang.cache))
+
+
+
+class ZeroDraws (numpy.random.RandomState):
+    """
+    every uniform draw comes out 0, the bottom edge of each row
+    """
+
+    def random_sample (self, size=None):
+        return numpy.zeros(size)
+
+
+class BatchTest (unittest.TestCase):
+    def test_row_boundary (self):
+        tmp = tempfile.mkdtemp()
+
+        try:
+            filename = os.path.join(tmp, "test.rules")
+
+            with open(filename, "w") as f:
+                f.write("action: name\nMy name is Fred.\n\n"
+                        "action: weather\nI don't know much about weather.\n\n"
+                        "regex: name_phrases\ninvokes: name\nyour name\n\n"
+                        "regex: weather_phrases\ninvokes: weather\nthe weather\n")
+
+            rules = fred_rules.Rule.parse_file(fred_lang.Language(), filename)
+        finally:
+            shutil.rmtree(tmp)
+
+        utterances = ["what is your name", "how is the weather", "your name and the weather"]
+        responses, selected, weights = rules.choose_rules(utterances, seed=ZeroDraws(1))
+        names = [rules.rule_list[i].name for i in selected]
+
+        self.assertEqual(names[:2], ["name", "weather"])
+        self.assertTrue(names[2] in ("name", "weather"))
+        self.assertEqual(list(weights), [2.0, 2.0, 2.0])
+
+
+if __name__=='__main__':
+    unittest.main()
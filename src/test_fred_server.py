@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_lang
+import fred_rules
+import fred_server
+
+import asyncore
+import errno
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+
+######################################################################
+## event-driven server tests
+## a ChatServer and its clients, all driven from the test's own loop
+######################################################################
+
+class CountingFRED (object):
+    """
+    stands in for fred_client.FRED, answering every line the same way
+    and counting the turns
+    """
+
+    def __init__ (self, rules):
+        self.rules = rules
+        self.turns = 0
+
+
+    def respond (self, utterance, session):
+        self.turns += 1
+        return "ok", session
+
+
+    def check_reload (self):
+        pass
+
+
+class ChatServerTest (unittest.TestCase):
+    def setUp (self):
+        self.dir = tempfile.mkdtemp()
+        filename = os.path.join(self.dir, "test.rules")
+
+        with open(filename, "w") as f:
+            f.write("action: hello\nHello.\n")
+
+        rules = fred_rules.Rule.parse_file(fred_lang.Language(), filename)
+        self.fred = CountingFRED(rules)
+        self.server = fred_server.ChatServer(self.fred, 0, host="127.0.0.1")
+
+        # small socket buffers, so flow control kicks in early; the
+        # accepted socket inherits the listening socket's
+        self.server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.client.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.client.connect(self.server.socket.getsockname())
+        self.client.setblocking(0)
+        self.poll()
+
+
+    def tearDown (self):
+        self.client.close()
+        asyncore.close_all(map=self.server.socket_map)
+        shutil.rmtree(self.dir)
+
+
+    def poll (self, count=10):
+        asyncore.loop(timeout=0.01, use_poll=True, map=self.server.socket_map, count=count)
+
+
+    def channel (self):
+        return list(self.server.channels)[0]
+
+
+    def send (self, data):
+        """
+        send as much as the socket takes without blocking
+        """
+
+        try:
+            return self.client.send(data)
+        except socket.error, e:
+            if e.args[0] == errno.EAGAIN:
+                return 0
+            raise
+
+
+    def test_pipelined_output_is_capped (self):
+        # keep pipelining lines without ever reading the responses,
+        # until the server stops taking them
+        lines = "hi\n" * 4096
+        total = 0
+        stalled = 0
+
+        while total < 2 ** 20 and stalled < 50:
+            sent = self.send(lines)
+            total += sent
+            stalled = 0 if sent else stalled + 1
+            self.poll(count=2)
+
+        channel = self.channel()
+        slack = channel.ac_in_buffer_size * len("ok\n> ") / len("hi\n")
+
+        self.assertTrue(total < 2 ** 20)
+        self.assertTrue(channel.output_size <= channel.max_output_size + slack)
+        self.assertEqual(channel.output_size, sum(map(len, channel.producer_fifo)))
+
+        # reading the responses lets the server carry on
+        turns = self.fred.turns
+
+        for i in xrange(100000):
+            if self.fred.turns > turns:
+                break
+
+            try:
+                self.client.recv(65536)
+            except socket.error, e:
+                if e.args[0] != errno.EAGAIN:
+                    raise
+
+            self.poll(count=1)
+
+        self.assertTrue(self.fred.turns > turns)
+
+
+
+    def test_line_too_long (self):
+        turns = self.fred.turns
+        self.client.setblocking(1)
+        self.client.settimeout(1.0)
+        self.client.recv(4096)
+
+        # the overlong line gets cut off, and neither its end nor the
+        # lines after it get answered
+        self.client.sendall("x" * 3000 + "\nhi\n" + "y" * 3000 + "\n")
+        received = []
+
+        for i in xrange(100):
+            self.poll(count=1)
+
+            try:
+                data = self.client.recv(4096)
+            except socket.timeout:
+                continue
+
+            if not data:
+                break
+
+            received.append(data)
+
+        self.assertEqual("".join(received), "ERROR: line too long\n")
+        self.assertEqual(self.fred.turns, turns)
+        self.assertEqual(len(self.server.channels), 0)
+
+
+if __name__=='__main__':
+    unittest.main()
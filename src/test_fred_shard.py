@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_lang
+import fred_rules
+import fred_shard
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+######################################################################
+## sharded rules tests
+## candidates gathered while a shard is down must not get cached
+######################################################################
+
+class ShardFailureTest (unittest.TestCase):
+    num_shards = 3
+    words = ["word%d" % i for i in xrange(30)]
+
+    def setUp (self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "test.rules")
+        self.lang = fred_lang.Language()
+
+        blocks = []
+
+        for (i, word) in enumerate(self.words):
+            blocks.append("action: a%d\nResponse %d.\n" % (i, i))
+            blocks.append("fuzzy: %s\n%d\ta%d\n" % (word, 1 + i % 5, i))
+
+        with open(self.filename, "w") as f:
+            f.write("\n".join(blocks))
+
+        self.procs, self.addresses = fred_shard.spawn_shards(self.filename, self.num_shards)
+        self.client = fred_shard.ShardClient(self.addresses)
+
+
+    def tearDown (self):
+        self.client.close()
+
+        for proc in self.procs:
+            if proc.poll() is None:
+                proc.terminate()
+
+            proc.wait()
+
+        shutil.rmtree(self.dir)
+
+
+    def test_failed_shard_not_cached (self):
+        rules = fred_shard.load_sharded(self.lang, self.filename, self.client)
+        utterance = " ".join(self.words)
+        stimulus, first = self.lang.scan(utterance)
+
+        full = rules.match_candidates(stimulus, first)
+        self.assertTrue(full.complete)
+        self.assertEqual(len(full.rule_set), len(self.words))
+
+        # with one shard gone, the turn still gets answered from the
+        # rest, but its candidates stay out of the cache
+        self.procs[0].terminate()
+        self.procs[0].wait()
+
+        rules.choose_rule(utterance)
+        self.assertFalse(stimulus in rules.candidate_cache)
+
+        partial = rules.match_candidates(stimulus, first)
+        self.assertFalse(partial.complete)
+        self.assertTrue(len(partial.rule_set) < len(self.words))
+
+        # once the shard is back on its port, the full set gets cached
+        host, port = self.addresses[0]
+        script = os.path.abspath(fred_shard.__file__).replace(".pyc", ".py")
+        self.procs[0] = subprocess.Popen([sys.executable, script, self.filename, "0", str(self.num_shards), str(port), host],
+                                         stdout=subprocess.PIPE)
+        self.assertTrue(self.procs[0].stdout.readline().startswith("listening"))
+
+        rules.choose_rule(utterance)
+        self.assertTrue(rules.candidate_cache.get(stimulus).complete)
+        self.assertEqual(len(rules.candidate_cache.get(stimulus).rule_set), len(self.words))
+
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+## Python impl of JFRED, developed by Robby Garner and Paco Nathan
+## See: http://www.robitron.com/JFRED.php
+## 
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+## 
+##     http://www.apache.org/licenses/LICENSE-2.0
+## 
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+
+import fred_lang
+import fred_rules
+import test_fred_reload
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+
+######################################################################
+## streaming match parity tests
+## words fed one at a time must total the same candidates as one
+## match_candidates() over the whole utterance
+######################################################################
+
+def weights (fuzzy_union):
+    return sorted([(name, round(weight, 6)) for (name, (rule, weight)) in fuzzy_union.rule_set.items()])
+
+
+class StreamMatchTest (unittest.TestCase):
+    # long enough words for typos to be corrected back to them
+    words = ["weather", "rainy", "breakfast", "coffee", "music", "guitar", "travel", "station",
+             "garden", "flowers", "computer", "keyboard", "holiday", "mountain", "river", "summer"]
+
+    def setUp (self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "test.rules")
+        self.lang = fred_lang.Language()
+        self.rand = random.Random(4)
+
+        rand = self.rand
+        actions = ["a%d" % i for i in xrange(10)]
+        blocks = [test_fred_reload.rule_text("action", name, ["Response %s." % name]) for name in actions]
+
+        for i in xrange(12):
+            phrases = [" ".join(rand.sample(self.words, rand.randint(1, 3))) for j in xrange(rand.randint(1, 3))]
+
+            if i % 4 == 0:
+                phrases.append("/%s \\w+ (%s|%s)/" % tuple(rand.sample(self.words, 3)))
+
+            blocks.append(test_fred_reload.rule_text("regex", "r%d" % i, phrases, { "invokes": rand.choice(actions) }))
+
+        for word in rand.sample(self.words, 8):
+            members = ["%d\t%s" % (rand.randint(1, 5), name) for name in rand.sample(actions, 2)]
+            blocks.append(test_fred_reload.rule_text("fuzzy", word, members))
+
+        with open(self.filename, "w") as f:
+            f.write("\n".join(blocks))
+
+
+    def tearDown (self):
+        shutil.rmtree(self.dir)
+
+
+    def utterance (self):
+        rand = self.rand
+        words = []
+
+        for i in xrange(rand.randint(1, 8)):
+            word = rand.choice(self.words + ["zz", "what", "the"])
+
+            if len(word) > 4 and rand.random() < 0.3:
+                # transpose two letters
+                j = rand.randrange(len(word) - 1)
+                word = word[:j] + word[j + 1] + word[j] + word[j + 2:]
+
+            words.append(word)
+
+        return " ".join(words)
+
+
+    def check_parity (self, rules):
+        for trial in xrange(300):
+            utterance = self.utterance()
+            stimulus, first = self.lang.scan(utterance)
+            expected = rules.match_candidates(stimulus, first)
+
+            stream = rules.start_match()
+
+            for word in utterance.split():
+                stream.feed(word)
+
+            streamed, fuzzy_union = stream.candidates()
+
+            self.assertEqual(streamed, stimulus)
+            self.assertEqual(stream.first, first)
+            self.assertEqual(weights(fuzzy_union), weights(expected), utterance)
+
+
+    def test_exact (self):
+        self.check_parity(fred_rules.Rule.parse_file(self.lang, self.filename))
+
+
+    def test_typos (self):
+        for distance in (1, 2):
+            rules = fred_rules.Rule.parse_file(self.lang, self.filename)
+            rules.enable_typos(max_distance=distance)
+            self.check_parity(rules)
+
+
+    def test_updated (self):
+        # a reloaded rulebase matches through an overlay of the edits
+        rules = fred_rules.Rule.parse_file(self.lang, self.filename)
+        extra = fred_rules.RegexRule().parse("extra", ["coffee music", "river"], { "invokes": "a1" })
+        self.check_parity(rules.update([extra], [], [], [], rules.first_action))
+
+
+if __name__=='__main__':
+    unittest.main()